@@ -16,12 +16,20 @@ def main():
     last_t = 0
     i = 0
     interval = 1
+    n_frames = 100
     cam = mi.Camera(pos=camera_pos, 
                 dir=camera_dir, 
                 up=camera_up, 
                 fov=2.0, 
                 res=(499,500),
-                is_perspective=False)
+                is_perspective=False,
+                max_frames=n_frames)
+    # The whole path of the camera is uploaded once, each frame only moves the frame index
+    cam.set_trajectory(
+        pos=camera_pos.to_numpy() + 0.1 * np.arange(1, n_frames + 1)[:, None],
+        dir=camera_dir.to_numpy(),
+        up=camera_up.to_numpy(),
+    )
     
     
     tracer = mi.RayMarchRenderer(scene=mi.Scene(objects=mi.cornell_box_scene()), 
@@ -33,8 +41,7 @@ def main():
 
     totals = []
     while True:
-        tracer.camera.pos = tracer.camera.pos + 0.1
-        print(tracer.camera.pos)
+        tracer.camera.frame = i
         last_t = time.time()
         tracer.render(light_normal)
         totals.append(tracer.total_brightness())
@@ -44,7 +51,7 @@ def main():
             tracer.show()
         i += 1
         # tracer.reset_buffer()
-        if i == 100:
+        if i == n_frames:
             break
     
     ti.profiler.print_scoped_profiler_info()
@@ -1,7 +1,4 @@
-import taichi as ti
-
-ti.init(arch=ti.gpu)
-
+from .runtime import *
 from .brdf import *
 from .march import *
 from .math import *
@@ -9,3 +6,9 @@ from .scenes import *
 from .sdf import *
 from .camera import *
 from .material import *
+from .stats import *
+from .parallel import *
+from .output import *
+from .wavefront import *
+from .mesh import *
+from .tiled import *
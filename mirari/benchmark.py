@@ -0,0 +1,265 @@
+"""Throughput benchmarks over the bundled scenes
+
+Run ``python -m mirari.benchmark --output report.json`` to write a report. Pass a previous report with
+``--baseline`` to compare against it, and the run exits with an error when throughput has regressed beyond
+``--tolerance``. Throughput depends on the machine, so the comparison is skipped when the baseline was taken
+on another platform or processor. :data:`BASELINE` is a reference report from one machine.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import taichi as ti
+
+from .camera import Camera
+from .march import RayMarchRenderer
+from .runtime import init
+from .scenes import Scene, cornell_box_scene, simple_scene, scene_three_objs, box_scene
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SCENES = {
+    "cornell_box": cornell_box_scene,
+    "simple": simple_scene,
+    "three_objs": scene_three_objs,
+    "box": box_scene,
+}
+
+# Reference report taken with the default settings, only comparable on the machine that wrote it
+BASELINE = os.path.join(os.path.dirname(__file__), "benchmark_baseline.json")
+
+# Metrics compared against a baseline, and whether larger values are better
+METRICS = {
+    "rays_per_s": True,
+    "samples_per_s": True,
+    "steps_per_ray": False,
+}
+
+# Report fields that must match for throughput to be comparable
+MACHINE = ("platform", "processor")
+
+
+def _peak_rss_mb() -> float:
+    if resource is None:
+        return float("nan")
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return rss / 2**20 if sys.platform == "darwin" else rss / 2**10
+
+
+def run_benchmark(
+    name: str,
+    res: tuple = (64, 64),
+    samples_per_pixel: int = 4,
+    max_bounces: int = 4,
+    renders: int = 8,
+    seed: int = 0,
+    collect_stats: bool = True,
+    **renderer_kwargs,
+) -> dict:
+    """Renders one of :data:`SCENES` with a fixed camera, light and seed and measures its throughput
+
+    The runtime must already be initialized, :func:`main` uses the CPU backend with the kernel cache off
+    so that the compile time is a real compile.
+
+    :param name: Key of :data:`SCENES`
+    :type name: str
+    :param res: Image resolution, defaults to (64, 64)
+    :type res: tuple, optional
+    :param samples_per_pixel: Samples per pixel of each render, defaults to 4
+    :type samples_per_pixel: int, optional
+    :param max_bounces: Bounce budget of each path, defaults to 4
+    :type max_bounces: int, optional
+    :param renders: Timed renders after one warm-up render, defaults to 8
+    :type renders: int, optional
+    :param seed: Sample stream of the renders, defaults to 0
+    :type seed: int, optional
+    :param collect_stats: Count rays and march steps on-device, which costs a few percent of throughput.
+        Without them the ray metrics are None and only samples/s is measured, defaults to True
+    :type collect_stats: bool, optional
+    :param renderer_kwargs: Passed on to :class:`mirari.march.RayMarchRenderer`
+    :return: Compile time, render time, rays/s, samples/s, march steps per ray and brightness
+    :rtype: dict
+    """
+    if name not in SCENES:
+        raise ValueError(f"name must be one of {sorted(SCENES)}, got {name!r}")
+    camera = Camera(
+        pos=ti.Vector([0.0, 0.0, 4.0]),
+        dir=ti.Vector([0.0, 0.0, -1.0]),
+        up=ti.Vector([0.0, 1.0, 0.0]),
+        fov=0.4,
+        res=res,
+        is_perspective=True,
+    )
+    renderer = RayMarchRenderer(
+        scene=Scene(objects=SCENES[name]()),
+        camera=camera,
+        max_bounces=max_bounces,
+        samples_per_pixel=samples_per_pixel,
+        store_image=False,
+        collect_stats=collect_stats,
+        **renderer_kwargs,
+    )
+    light_normal = ti.Vector([0.0, 0.0, -1.0])
+
+    t0 = time.perf_counter()
+    renderer.precompile()
+    ti.sync()
+    compile_time = time.perf_counter() - t0
+
+    renderer.set_seed(seed)
+    renderer.render(light_normal)
+    renderer.reset_buffer()
+
+    rays = steps = 0
+    elapsed = 0.0
+    for _ in range(renders):
+        t0 = time.perf_counter()
+        renderer.render(light_normal)
+        ti.sync()
+        elapsed += time.perf_counter() - t0
+        if collect_stats:
+            # Stats are reset by every render
+            stats = renderer.march_stats()
+            rays += stats["rays"]
+            steps += stats["steps"]
+
+    samples = res[0] * res[1] * samples_per_pixel * renders
+    return dict(
+        compile_time=compile_time,
+        render_time=elapsed,
+        rays=rays if collect_stats else None,
+        samples=samples,
+        rays_per_s=rays / elapsed if collect_stats else None,
+        samples_per_s=samples / elapsed,
+        steps_per_ray=steps / max(rays, 1) if collect_stats else None,
+        brightness=renderer.brightness_estimate().mean,
+    )
+
+
+def run_benchmarks(names: list = None, **kwargs) -> dict:
+    """Runs :func:`run_benchmark` on several scenes
+
+    :param names: Keys of :data:`SCENES`, defaults to all of them
+    :type names: list, optional
+    :param kwargs: Passed on to :func:`run_benchmark`
+    :return: Report with the benchmark settings, the platform, the results of each scene and the peak
+        memory of the process, which is not attributable to one scene
+    :rtype: dict
+    """
+    names = list(SCENES) if names is None else names
+    results = {name: run_benchmark(name, **kwargs) for name in names}
+    return dict(
+        settings=kwargs,
+        taichi_version=".".join(str(x) for x in ti.__version__),
+        platform=platform.platform(),
+        processor=platform.processor(),
+        results=results,
+        peak_rss_mb=_peak_rss_mb(),
+    )
+
+
+def compare(report: dict, baseline: dict, tolerance: float = 0.1) -> list:
+    """Finds the metrics of a report that are worse than a baseline report by more than a tolerance
+
+    Only scenes and :data:`METRICS` measured in both reports are compared. Baselines are only meaningful
+    when taken on the same machine with the same settings, see :func:`same_machine`.
+
+    :param report: Report from :func:`run_benchmarks`
+    :type report: dict
+    :param baseline: Earlier report to compare against
+    :type baseline: dict
+    :param tolerance: Allowed relative change, defaults to 0.1
+    :type tolerance: float, optional
+    :return: A description of each regression, empty if there are none
+    :rtype: list
+    """
+    if report.get("settings") != baseline.get("settings"):
+        raise ValueError(
+            f"The report was run with {report.get('settings')}, but the baseline with {baseline.get('settings')}"
+        )
+    regressions = []
+    for name, result in report["results"].items():
+        if name not in baseline["results"]:
+            continue
+        for metric, larger_is_better in METRICS.items():
+            new, old = result.get(metric), baseline["results"][name].get(metric)
+            if new is None or old is None:
+                continue
+            change = (new - old) / old if old else 0.0
+            if (-change if larger_is_better else change) > tolerance:
+                regressions.append(f"{name} {metric}: {old:.4g} -> {new:.4g} ({100 * change:+.1f}%)")
+    return regressions
+
+
+def same_machine(report: dict, baseline: dict) -> bool:
+    """Whether two reports were taken on the same platform and processor, so their throughput compares
+
+    :param report: Report from :func:`run_benchmarks`
+    :type report: dict
+    :param baseline: Earlier report
+    :type baseline: dict
+    :rtype: bool
+    """
+    return all(report.get(key) == baseline.get(key) for key in MACHINE)
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scenes", nargs="+", choices=sorted(SCENES), default=list(SCENES))
+    parser.add_argument("--res", type=int, nargs=2, default=[64, 64])
+    parser.add_argument("--samples-per-pixel", type=int, default=4)
+    parser.add_argument("--max-bounces", type=int, default=4)
+    parser.add_argument("--renders", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cpu-threads", type=int, default=None)
+    parser.add_argument(
+        "--no-stats", action="store_true", help="Time renders without the ray and march step counters"
+    )
+    parser.add_argument("--output", help="Path of the JSON report, printed if omitted")
+    parser.add_argument("--baseline", help="Path of a previous JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    init(arch="cpu", cpu_threads=args.cpu_threads, offline_cache=False, random_seed=args.seed)
+    report = run_benchmarks(
+        args.scenes,
+        res=args.res,
+        samples_per_pixel=args.samples_per_pixel,
+        max_bounces=args.max_bounces,
+        renders=args.renders,
+        seed=args.seed,
+        collect_stats=not args.no_stats,
+    )
+    report["cpu_threads"] = args.cpu_threads
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if not same_machine(report, baseline):
+            print(
+                f"Not comparing, the baseline was taken on {baseline.get('platform')} {baseline.get('processor')!r}",
+                file=sys.stderr,
+            )
+            return 0
+        regressions = compare(report, baseline, args.tolerance)
+        for r in regressions:
+            print(f"Regression: {r}", file=sys.stderr)
+        return int(len(regressions) > 0)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -38,9 +38,22 @@ def fresnel_schlick(H: ti.math.vec3, L: ti.math.vec3, cs: float) -> float:
 
 @ti.func
 def sample_ggx_micro_normal_tangent(a2: float) -> ti.math.vec3:
-    e1 = ti.random()
-    e2 = ti.random()
+    return ggx_micro_normal_tangent(a2, ti.random(), ti.random())
 
+
+@ti.func
+def ggx_micro_normal_tangent(a2: float, e1: float, e2: float) -> ti.math.vec3:
+    """Maps a point in the unit square to a GGX distributed micro normal in the tangent frame
+
+    :param a2: Surface roughness, squared
+    :type a2: float
+    :param e1: Uniform sample in [0, 1)
+    :type e1: float
+    :param e2: Uniform sample in [0, 1)
+    :type e2: float
+    :return: Micro normal, with the macro normal along +z
+    :rtype: ti.math.vec3
+    """
     # theta = ti.atan2(ti.sqrt(a2*e1/(1-e1)),1) # GGX
     theta = ti.acos(ti.sqrt((1 - e1) / (e1 * (a2 - 1) + 1)))  # GGX
     phi = 2 * np.pi * e2
@@ -58,6 +71,34 @@ def sample_ggx_micro_normal_world(N: ti.math.vec3, a2: float) -> ti.math.vec3:
     return wm
 
 
+@ti.func
+def ggx_micro_normal_world(N: ti.math.vec3, a2: float, e1: float, e2: float) -> ti.math.vec3:
+    """Maps a point in the unit square to a GGX distributed micro normal about ``N``
+
+    Unlike :func:`sample_ggx_micro_normal_world`, the tangent frame is a fixed function of ``N``, so
+    the micro normal depends only on ``e1`` and ``e2``.
+
+    :param N: Macro surface normal
+    :type N: ti.math.vec3
+    :param a2: Surface roughness, squared
+    :type a2: float
+    :param e1: Uniform sample in [0, 1)
+    :type e1: float
+    :param e2: Uniform sample in [0, 1)
+    :type e2: float
+    :return: Micro normal
+    :rtype: ti.math.vec3
+    """
+    # Branchless orthonormal basis, Duff et al. 2017
+    sign = 1.0 if N.z >= 0.0 else -1.0
+    a = -1.0 / (sign + N.z)
+    b = N.x * N.y * a
+    x = ti.math.vec3(1.0 + sign * N.x * N.x * a, sign * b, -sign * N.x)
+    y = ti.math.vec3(b, sign + N.y * N.y * a, -N.y)
+    t = ggx_micro_normal_tangent(a2, e1, e2)
+    return t.x * x + t.y * y + t.z * N
+
+
 @ti.func
 def ggx_reflectance(
     wi: ti.math.vec3,
@@ -75,3 +116,50 @@ def ggx_reflectance(
     if not ok:
         integrand_importance = 0
     return integrand_importance
+
+
+@ti.func
+def ggx_eval(
+    wi: ti.math.vec3, wo: ti.math.vec3, N: ti.math.vec3, cs: float, a2: float
+) -> float:
+    """Evaluates the GGX BRDF times the cosine of the incident direction, consistent with the weights of :func:`ggx_reflectance`
+
+    :param wi: Incident (light) direction
+    :type wi: ti.math.vec3
+    :param wo: Outgoing (view) direction
+    :type wo: ti.math.vec3
+    :param N: Macro surface normal
+    :type N: ti.math.vec3
+    :param cs: Specular coefficient
+    :type cs: float
+    :param a2: Surface roughness, squared
+    :type a2: float
+    :return: BRDF times ``dot(N, wi)``
+    :rtype: float
+    """
+    res = 0.0
+    if ti.math.dot(N, wi) > 0.0 and ti.math.dot(N, wo) > 0.0:
+        H = (wi + wo).normalized()
+        F = fresnel_schlick(H, wi, cs)
+        G2 = g_smith(wi, N, wo, ti.sqrt(a2))
+        res = F * G2 * ggx(H, N, a2) / (4 * ti.math.dot(N, wo))
+    return res
+
+
+@ti.func
+def ggx_pdf(wi: ti.math.vec3, wo: ti.math.vec3, N: ti.math.vec3, a2: float) -> float:
+    """Solid angle density of ``wi`` when reflecting ``wo`` about a micro normal from :func:`sample_ggx_micro_normal_world`"""
+    H = (wi + wo).normalized()
+    return ggx(H, N, a2) * rdot(N, H) / (4 * ti.abs(ti.math.dot(wo, H)) + 1e-12)
+
+
+@ti.func
+def diffuse_eval(wi: ti.math.vec3, N: ti.math.vec3) -> float:
+    """Diffuse BRDF times the cosine of the incident direction, consistent with weighting cosine samples by ``dot(N, wi)``"""
+    return rdot(N, wi) ** 2 / np.pi
+
+
+@ti.func
+def diffuse_pdf(wi: ti.math.vec3, N: ti.math.vec3) -> float:
+    """Solid angle density of cosine-weighted hemisphere sampling"""
+    return rdot(N, wi) / np.pi
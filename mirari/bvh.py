@@ -0,0 +1,84 @@
+from typing import Tuple
+
+import numpy as np
+import taichi as ti
+
+
+@ti.dataclass
+class BVHNode:
+    center: ti.math.vec3
+    radius: float
+    skip: int  # Next node to visit if this node's subtree is culled
+    leaf: int  # Index of the bounded item, -1 for internal nodes
+
+
+def merge_spheres(
+    c1: np.ndarray, r1: float, c2: np.ndarray, r2: float
+) -> Tuple[np.ndarray, float]:
+    """Smallest sphere enclosing two spheres
+
+    :param c1: Center of the first sphere
+    :type c1: np.ndarray [3,]
+    :param r1: Radius of the first sphere
+    :type r1: float
+    :param c2: Center of the second sphere
+    :type c2: np.ndarray [3,]
+    :param r2: Radius of the second sphere
+    :type r2: float
+    :return: Center and radius of the enclosing sphere
+    :rtype: Tuple[np.ndarray, float]
+    """
+    d = np.linalg.norm(c2 - c1)
+    if d + r2 <= r1:
+        return c1, r1
+    if d + r1 <= r2:
+        return c2, r2
+    r = (d + r1 + r2) / 2
+    return c1 + (r - r1) / d * (c2 - c1), r
+
+
+def build_sphere_bvh(centers: np.ndarray, radii: np.ndarray) -> dict:
+    """Builds a bounding sphere hierarchy over a set of spheres, flattened in preorder
+
+    Each node stores the index of the node following its subtree, so the tree can be walked without
+    a stack: visit ``i + 1`` to descend, or jump to ``skip`` to cull the subtree.
+
+    :param centers: Centers of the bounding spheres of each item
+    :type centers: np.ndarray [nx3]
+    :param radii: Radii of the bounding spheres of each item
+    :type radii: np.ndarray [n,]
+    :return: Node arrays keyed by :class:`BVHNode` member, suitable for ``BVHNode.field.from_numpy``
+    :rtype: dict
+    """
+    centers = np.asarray(centers, dtype=np.float64).reshape(-1, 3)
+    radii = np.asarray(radii, dtype=np.float64).reshape(-1)
+    n_nodes = max(2 * centers.shape[0] - 1, 1)
+    node_center = np.zeros((n_nodes, 3), dtype=np.float32)
+    node_radius = np.zeros(n_nodes, dtype=np.float32)
+    node_skip = np.zeros(n_nodes, dtype=np.int32)
+    node_leaf = np.full(n_nodes, -1, dtype=np.int32)
+
+    next_node = 0
+
+    def build(items: np.ndarray) -> Tuple[np.ndarray, float]:
+        nonlocal next_node
+        node = next_node
+        next_node += 1
+        if items.size == 1:
+            c, r = centers[items[0]], radii[items[0]]
+            node_leaf[node] = items[0]
+        else:
+            extent = np.ptp(centers[items], axis=0)
+            order = np.argsort(centers[items, np.argmax(extent)], kind="stable")
+            half = items.size // 2
+            c, r = merge_spheres(
+                *build(items[order[:half]]), *build(items[order[half:]])
+            )
+        node_center[node] = c
+        node_radius[node] = r
+        node_skip[node] = next_node
+        return c, r
+
+    if centers.shape[0]:
+        build(np.arange(centers.shape[0]))
+    return dict(center=node_center, radius=node_radius, skip=node_skip, leaf=node_leaf)
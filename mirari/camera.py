@@ -1,6 +1,45 @@
+from typing import Tuple
+
 import taichi as ti
 import numpy as np
 
+from .runtime import ensure_init
+
+
+@ti.func
+def look_dcm(dir: ti.math.vec3, up: ti.math.vec3) -> ti.math.mat3:
+    """Builds the camera basis for a given look direction, in the same row layout as :meth:`Camera.orthonormalize`
+
+    :param dir: Look direction of the camera
+    :type dir: ti.math.vec3
+    :param up: Approximate up direction of the camera, a fallback is chosen if it is parallel to ``dir``
+    :type up: ti.math.vec3
+    :return: Matrix with rows ``(x, up, dir)``
+    :rtype: ti.math.mat3
+    """
+    d = dir.normalized()
+    x = up.cross(d)
+    if x.norm() < 1e-6:
+        x = ti.math.vec3(0.0, 0.0, 1.0).cross(d)
+        if x.norm() < 1e-6:
+            x = ti.math.vec3(1.0, 0.0, 0.0).cross(d)
+    x = x.normalized()
+    up_perp = d.cross(x)
+    x = up_perp.cross(d)
+    return ti.math.mat3(x, up_perp, d)
+
+
+def _vec3(v) -> ti.math.vec3:
+    v = v.to_numpy() if hasattr(v, "to_numpy") else v
+    return ti.math.vec3(*np.asarray(v, dtype=np.float32).reshape(3))
+
+
+def _tangent_slopes(c: float, depth: float, radius: float) -> np.ndarray:
+    # Slopes of the two lines through the origin tangent to a circle at (c, depth), which must not contain the origin
+    root = radius * np.sqrt(c**2 + depth**2 - radius**2)
+    return (c * depth + np.array([-root, root])) / (depth**2 - radius**2)
+
+
 @ti.dataclass
 class Ray:
     position: ti.math.vec3
@@ -10,102 +49,214 @@ class Ray:
 @ti.data_oriented
 class Camera:
 
-    def __init__(self, pos, dir, up, res, fov, is_perspective: bool):
-        self.pos_field = ti.field(dtype=ti.f32, shape=(3,))
-        self.dir_field = ti.field(dtype=ti.f32, shape=(3,))
-        self.up_field = ti.field(dtype=ti.f32, shape=(3,))
+    def __init__(self, pos, dir, up, res, fov, is_perspective: bool, max_frames: int = 1):
+        """A camera whose pose can follow a trajectory of up to ``max_frames`` frames held on-device
+
+        The pose of every frame is uploaded at once with :meth:`set_trajectory`, after which moving the
+        camera is only a change of :attr:`frame`, and renderers can render many frames in one kernel launch.
+
+        :param max_frames: Most frames a trajectory can have, defaults to 1
+        :type max_frames: int, optional
+        """
+        ensure_init()
+        if max_frames < 1:
+            raise ValueError(f"max_frames must be at least 1, got {max_frames}")
+        self.max_frames = max_frames
+        self.pos_field = ti.Vector.field(3, dtype=ti.f32, shape=max_frames)
+        self.dir_field = ti.Vector.field(3, dtype=ti.f32, shape=max_frames)
+        self.up_field = ti.Vector.field(3, dtype=ti.f32, shape=max_frames)
+        self._frame = ti.field(dtype=ti.i32, shape=())
+        self.n_frames = 1
+        self._frame_index = 0
         self.res = res
         self.res_vector = ti.Vector([*res])
         self.fov = fov
         self.is_perspective = is_perspective
 
-        self.pos = pos.to_numpy()
-        self.up = up.to_numpy()
-        self.dir = dir.to_numpy()
+        self.set_trajectory(pos, dir, up)
+
+    def set_trajectory(self, pos: np.ndarray, dir: np.ndarray, up: np.ndarray) -> None:
+        """Uploads the pose of every frame in one transfer and moves the camera to the first frame
+
+        :param pos: Position at each frame
+        :type pos: np.ndarray [nx3]
+        :param dir: Look direction at each frame, or one direction for all frames
+        :type dir: np.ndarray [nx3] or [3,]
+        :param up: Up direction at each frame, or one direction for all frames
+        :type up: np.ndarray [nx3] or [3,]
+        """
+        pos, dir, up = (
+            np.asarray(v.to_numpy() if hasattr(v, "to_numpy") else v, dtype=np.float32).reshape(-1, 3)
+            for v in (pos, dir, up)
+        )
+        n = pos.shape[0]
+        if n > self.max_frames:
+            raise ValueError(
+                f"The trajectory has {n} frames, this Camera was created with max_frames={self.max_frames}"
+            )
+        dir, up = (np.ascontiguousarray(np.broadcast_to(v, (n, 3))) for v in (dir, up))
+        self._upload_trajectory(np.ascontiguousarray(pos), dir, up)
+        self.n_frames = n
+        self.frame = 0
+
+    @ti.kernel
+    def _upload_trajectory(
+        self,
+        pos: ti.types.ndarray(dtype=ti.math.vec3, ndim=1),
+        dir: ti.types.ndarray(dtype=ti.math.vec3, ndim=1),
+        up: ti.types.ndarray(dtype=ti.math.vec3, ndim=1),
+    ):
+        for i in pos:
+            self.pos_field[i] = pos[i]
+            self.dir_field[i] = dir[i]
+            self.up_field[i] = up[i]
+
+    @property
+    def frame(self) -> int:
+        """Frame of the trajectory the camera is at"""
+        return self._frame_index
+
+    @frame.setter
+    def frame(self, i: int):
+        if not 0 <= i < self.n_frames:
+            raise ValueError(f"frame must be in [0, {self.n_frames}), got {i}")
+        self._frame_index = int(i)
+        self._frame[None] = self._frame_index
+
+    def advance(self, step: int = 1) -> None:
+        """Moves the camera ``step`` frames along its trajectory, wrapping around at the end"""
+        self.frame = (self._frame_index + step) % self.n_frames
 
     @ti.func
     def _pos(self):
-        return ti.math.vec3(self.pos_field[0], self.pos_field[1], self.pos_field[2])
+        return self.pos_field[self._frame[None]]
 
     @ti.func
     def _dir(self):
-        return ti.math.vec3(self.dir_field[0], self.dir_field[1], self.dir_field[2])
+        return self.dir_field[self._frame[None]]
 
     @ti.func
     def _up(self):
-        return ti.math.vec3(self.up_field[0], self.up_field[1], self.up_field[2])
+        return self.up_field[self._frame[None]]
 
     @property
     def pos(self):
-        return ti.Vector(
-            [self.pos_field[0], self.pos_field[1], self.pos_field[2]]
-        )
+        return self._read_pose(self.pos_field)
 
     @property
     def dir(self):
-        return ti.Vector(
-            [self.dir_field[0], self.dir_field[1], self.dir_field[2]]
-        )
+        return self._read_pose(self.dir_field)
 
     @property
     def up(self):
-        return ti.Vector(
-            [self.up_field[0], self.up_field[1], self.up_field[2]]
-        )
+        return self._read_pose(self.up_field)
 
     @pos.setter
     def pos(self, v: np.ndarray):
-        for i, vi in enumerate(v):
-            self.pos_field[i] = vi
+        self._write_pose(self.pos_field, _vec3(v))
 
     @dir.setter
     def dir(self, v: np.ndarray):
-        for i, vi in enumerate(v):
-            self.dir_field[i] = vi
+        self._write_pose(self.dir_field, _vec3(v))
 
     @up.setter
     def up(self, v: np.ndarray):
-        for i, vi in enumerate(v):
-            self.up_field[i] = vi
+        self._write_pose(self.up_field, _vec3(v))
+
+    @ti.kernel
+    def _read_pose(self, field: ti.template()) -> ti.math.vec3:
+        return field[self._frame[None]]
+
+    @ti.kernel
+    def _write_pose(self, field: ti.template(), v: ti.math.vec3):
+        field[self._frame[None]] = v
+
+    def footprint(self, center: np.ndarray, radius: float) -> Tuple[int, int, int, int]:
+        """Pixels of the current frame whose rays can reach a sphere
+
+        :param center: Center of the sphere
+        :type center: np.ndarray [3,]
+        :param radius: Radius of the sphere
+        :type radius: float
+        :return: Pixel ranges ``(u0, u1, v0, v1)`` with exclusive upper bounds, empty if no ray reaches the sphere
+        :rtype: Tuple[int, int, int, int]
+        """
+        res_x, res_y = (int(x) for x in self.res)
+        aspect = res_x / res_y
+        pos, d, up = (np.asarray(v.to_numpy(), dtype=np.float64) for v in (self.pos, self.dir, self.up))
+        # Same basis as orthonormalize, its axes are orthogonal but not necessarily unit length
+        x = np.cross(up, d)
+        up_perp = np.cross(d, x)
+        x = np.cross(up_perp, d)
+        norms = [np.linalg.norm(v) for v in (x, up_perp, d)]
+        if min(norms) == 0:
+            return 0, res_x, 0, res_y
+        rel = np.asarray(center, dtype=np.float64) - pos
+        cx, cy, cz = (rel @ v / n for v, n in zip((x, up_perp, d), norms))
+        radius = radius * (1 + 1e-4) + 1e-4
+
+        if self.is_perspective:
+            if cz <= radius:  # The sphere surrounds or reaches behind the camera
+                return 0, res_x, 0, res_y
+            # Image plane coordinates of the lines through the camera tangent to the sphere
+            x_range = _tangent_slopes(cx, cz, radius) * norms[2] / norms[0]
+            y_range = _tangent_slopes(cy, cz, radius) * norms[2] / norms[1]
+            u_range = (x_range + self.fov * aspect) * res_y / (2 * self.fov)
+            v_range = (y_range + self.fov) * res_y / (2 * self.fov)
+        else:
+            if cz < -radius:  # The sphere is behind the camera
+                return 0, 0, 0, 0
+            u_range = ((cx + np.array([-radius, radius])) / (aspect * self.fov * norms[0]) + 0.5) * res_x
+            v_range = ((cy + np.array([-radius, radius])) / (self.fov * norms[1]) + 0.5) * res_y
+
+        # Pixel u covers samples in [u, u + 1), one pixel of margin absorbs rounding
+        u0, u1 = (int(np.clip(b, 0, res_x)) for b in (np.floor(u_range[0]) - 1, np.floor(u_range[1]) + 2))
+        v0, v1 = (int(np.clip(b, 0, res_y)) for b in (np.floor(v_range[0]) - 1, np.floor(v_range[1]) + 2))
+        if u1 <= u0 or v1 <= v0:
+            return 0, 0, 0, 0
+        return u0, u1, v0, v1
 
     @ti.func
     def orthonormalize(self):
-        up = self._up()
-        dir = self._dir()
+        return self.frame_dcm(self._frame[None])
+
+    @ti.func
+    def frame_dcm(self, f: int):
+        """Camera basis at frame ``f`` of the trajectory, with rows ``(x, up, dir)``"""
+        up = self.up_field[f]
+        dir = self.dir_field[f]
         x = up.cross(dir)
         up_perp = dir.cross(x)
         x = up_perp.cross(dir)
         return ti.math.mat3(x, up_perp, dir)
 
     @ti.func
-    def init_ray(self, u: int, v: int, fov: float, res: ti.math.vec2, dcm: ti.math.mat3, is_perspective: bool):
-        pos, d = self.init_ray_orthographic(u, v, fov=fov, res=res, dcm=dcm)
+    def init_ray(self, u: float, v: float, pos: ti.math.vec3, fov: float, res: ti.math.vec2, dcm: ti.math.mat3, is_perspective: bool):
+        r, d = self.init_ray_orthographic(u, v, pos=pos, fov=fov, res=res, dcm=dcm)
         if is_perspective:
-            pos, d = self.init_ray_perspective(u, v, fov=fov, res=res, dcm=dcm)
-        print(pos, d)
-        return Ray(position=pos, direction=d, power=1.0)
+            r, d = self.init_ray_perspective(u, v, pos=pos, fov=fov, res=res, dcm=dcm)
+        return Ray(position=r, direction=d, power=1.0)
 
     @ti.func
-    def init_ray_orthographic(self, u: int, v: int, fov: float, res: ti.math.vec2, dcm: ti.math.mat3):
+    def init_ray_orthographic(self, u: float, v: float, pos: ti.math.vec3, fov: float, res: ti.math.vec2, dcm: ti.math.mat3):
         aspect_ratio = res.x / res.y
         camera_x = dcm[0,:]
         camera_up_perp = dcm[1,:]
 
         frac_x = (v + 0) / res.y
         frac_y = (u + 0) / res.x
-        pos = (
-            self._pos()
+        r = (
+            pos
             + fov * (frac_x - 0.5) * camera_up_perp
             + aspect_ratio * fov * (frac_y - 0.5) * camera_x
         )
-        return pos, dcm[2,:]
+        return r, dcm[2,:]
 
     @ti.func
-    def init_ray_perspective(self, u: int, v: int, fov: float, res: ti.math.vec2, dcm: ti.math.mat3):
+    def init_ray_perspective(self, u: float, v: float, pos: ti.math.vec3, fov: float, res: ti.math.vec2, dcm: ti.math.mat3):
         aspect_ratio = res.x / res.y
-        pos = self._pos()
         d = (
-            dcm
+            dcm.transpose()
             @ ti.Vector(
                 [
                     (
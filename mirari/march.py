@@ -1,12 +1,38 @@
-from typing import Tuple
+import os
+from typing import Optional, Tuple
 
 import numpy as np
 import taichi as ti
 
-from .brdf import sample_ggx_micro_normal_world, ggx_reflectance, reflect
+from .brdf import (
+    ggx_micro_normal_world,
+    ggx_reflectance,
+    ggx_eval,
+    ggx_pdf,
+    diffuse_eval,
+    diffuse_pdf,
+    reflect,
+)
 from .scenes import Scene
-from .math import rdot, random_direction
-from .camera import Camera, Ray
+from .math import rdot, sphere_direction, cone_direction, attitude_dcm
+from .camera import Camera, Ray, look_dcm
+from .stats import BrightnessEstimate, RenderStats, TERMINATIONS
+from .sampler import (
+    SamplerState,
+    pixel_seed,
+    sobol_1d,
+    sobol_2d_padded,
+    random_1d,
+    random_2d,
+)
+from .runtime import ensure_init
+
+# Statistics counters are spread over lanes picked by the hashed seed of the pixel, so
+# concurrent threads rarely add to the same address
+STATS_LANES = 64
+# Columns of the statistics counters, followed by one per reason in TERMINATIONS
+_RAYS, _STEPS, _PATHS, _BOUNCES, _NANS = range(5)
+_DIVERGED, _LIGHT, _MAX_BOUNCES, _ROULETTE = range(5, 5 + len(TERMINATIONS))
 
 
 @ti.data_oriented
@@ -21,7 +47,21 @@ class RayMarchRenderer:
         show_gui: bool = False,
         gui_fps_limit: int = 1_000,
         max_march_steps: int = 100,
+        store_image: bool = True,
+        march_mode: str = "plain",
+        relaxation: float = 1.6,
+        hit_tolerance: float = 1e-3,
+        collect_stats: bool = False,
+        light_sampling: bool = False,
+        directional_light: bool = False,
+        sun_irradiance: float = 1.0,
+        sun_angular_radius: float = 0.0,
+        russian_roulette: bool = False,
+        min_bounces: int = 2,
+        sampler: str = "random",
+        clip_rays: bool = True,
     ) -> None:
+        ensure_init()
         self.scene = scene
         self.camera = camera
 
@@ -31,13 +71,113 @@ class RayMarchRenderer:
         self.max_march_steps = max_march_steps
         self.res = tuple([int(x) for x in self.camera.res])
 
-        self.color_buffer = ti.Vector.field(1, dtype=ti.f32, shape=self.res)
+        if march_mode not in ("plain", "relaxed"):
+            raise ValueError(
+                f"march_mode must be 'plain' or 'relaxed', got {march_mode!r}"
+            )
+        self.march_mode = march_mode
+        self.relaxation = relaxation
+        self.hit_tolerance = hit_tolerance
+        self.collect_stats = collect_stats
+        # Emitters are counted at runtime, so scenes without any just skip the light samples
+        self.light_sampling = light_sampling
+        # The sun is a light at infinity travelling along light_normal, it is only
+        # reached through shadow rays so surfaces must be lit by direct estimates
+        self.directional_light = directional_light
+        self.sun_irradiance = sun_irradiance
+        if sun_angular_radius < 0 or sun_angular_radius >= np.pi / 2:
+            raise ValueError(
+                f"sun_angular_radius must be in [0, pi/2) radians, got {sun_angular_radius}"
+            )
+        self.sun_angular_radius = sun_angular_radius
+        # Past min_bounces, paths survive each bounce with probability equal to their throughput
+        self.russian_roulette = russian_roulette
+        if min_bounces < 1:
+            raise ValueError(f"min_bounces must be at least 1, got {min_bounces}")
+        self.min_bounces = min_bounces
+        if sampler not in ("random", "sobol"):
+            raise ValueError(f"sampler must be 'random' or 'sobol', got {sampler!r}")
+        # Sobol points are best stratified when samples_per_pixel is a power of two
+        self.sampler = sampler
+        # Rays only march inside the scene's bounding sphere, and pixels whose camera rays miss it are not launched
+        self.clip_rays = clip_rays
+        self._batch_seed = 0
+        if collect_stats:
+            self._stats_counts = ti.field(dtype=ti.i64, shape=(STATS_LANES, 5 + len(TERMINATIONS)))
+            self._step_histogram = ti.field(dtype=ti.i64, shape=(STATS_LANES, max_march_steps + 1))
+            self._object_hits = ti.field(dtype=ti.i64, shape=(STATS_LANES, scene.capacity))
+
+        self.store_image = store_image
+        if show_gui and not store_image:
+            raise ValueError("show_gui=True requires store_image=True")
+
+        # Brightness and invalid sample counts are accumulated on-device, so producing
+        # a light curve point never needs the image on the host
+        self._power_sum = ti.field(dtype=ti.f64, shape=())
+        self._nan_count = ti.field(dtype=ti.i64, shape=())
+        # Each render is a batch, these hold the sum, sum of squares and count of batch brightnesses
+        self._batch_moments = ti.field(dtype=ti.f64, shape=3)
+        self._last_power_sum = ti.field(dtype=ti.f64, shape=())
+        if store_image:
+            self.color_buffer = ti.Vector.field(1, dtype=ti.f32, shape=self.res)
         if show_gui:
             self.gui = ti.GUI("Mirari Ray Marcher", self.res)
             self.gui.fps_limit = gui_fps_limit
 
         self._j = 0
 
+    def precompile(self) -> None:
+        """Compiles every kernel this renderer launches without rendering anything
+
+        Compiled kernels go to the on-disk cache in ``mirari.CACHE_DIR``, keyed by the kernel source and
+        the renderer and scene configuration baked into them. A later process that builds a renderer with
+        the same configuration loads them from the cache instead of compiling, so worker processes can
+        call this at startup, or a setup step can call it once to warm the cache for all of them.
+
+        The launches do no work, so anything already accumulated is left as it was.
+        """
+        self.scene.precompile()
+        self._reset_buffer(0)
+        # Zero samples per pixel and no active epochs launch every kernel with no work
+        self._render(
+            0,
+            0,
+            0,
+            0,
+            ti.math.vec3(0.0, 0.0, -1.0),
+            0,
+            self.max_bounces,
+            self.camera.fov,
+            self.camera.res_vector,
+            self.camera.is_perspective,
+            self.divergence_dist,
+            self.max_march_steps,
+            0.0,
+            0,
+        )
+        epochs = self._light_curve_inputs(
+            np.zeros((1, 3)), np.zeros((1, 3)), np.zeros((1, 3))
+        )
+        none_active = np.zeros(0, dtype=np.int32)
+        batch = ti.ndarray(dtype=ti.f64, shape=1)
+        self._render_trajectory(
+            none_active,
+            batch,
+            ti.math.vec3(0.0, 0.0, -1.0),
+            0,
+            self.max_bounces,
+            self.camera.fov,
+            self.camera.res_vector,
+            self.camera.is_perspective,
+            self.divergence_dist,
+            self.max_march_steps,
+            0,
+        )
+        self._render_light_curve_batch(*epochs, none_active, batch, batch_seed=0)
+        self._accumulate_moments(
+            none_active, batch, ti.ndarray(dtype=ti.f64, shape=(1, 3)), 0.0
+        )
+
     def show(self):
         if not hasattr(self, "gui"):
             raise ValueError(
@@ -53,61 +193,288 @@ class RayMarchRenderer:
         ray: Ray,
         divergence_dist: float,
         max_march_steps: int,
-    ) -> Tuple[float, ti.types.struct]:
+        lane: int,
+    ) -> Tuple[float, int]:
         j = 0
-        dist_marched = 0.0
-        closest_obj = self.scene.objects[0]
-        while j < max_march_steps and dist_marched < divergence_dist:
-            new_dist, closest_obj = self.scene.sdf(ray.position + dist_marched * ray.direction)
-            dist_marched += new_dist
-            if new_dist < 1e-6:
-                break
-            j += 1
+        closest_obj = 0
+        # Only the part of the ray inside the scene's bounding sphere can hit anything
+        t0, t1 = 0.0, divergence_dist
+        if ti.static(self.clip_rays):
+            t0, t1 = self.scene.clip(ray.position, ray.direction, divergence_dist)
+        dist_marched = t0
+        if ti.static(self.march_mode == "relaxed"):
+            dist_marched, closest_obj, j = self._march_relaxed(
+                ray, t0, t1, max_march_steps
+            )
+        else:
+            while j < max_march_steps and dist_marched < t1:
+                new_dist, closest_obj = self.scene.sdf(ray.position + dist_marched * ray.direction)
+                dist_marched += new_dist
+                if new_dist < 1e-6:
+                    break
+                j += 1
+        if dist_marched >= t1:  # Then the ray has left the scene
+            dist_marched = divergence_dist
+        if ti.static(self.collect_stats):
+            self._stats_counts[lane, _RAYS] += 1
+            self._stats_counts[lane, _STEPS] += j
+            self._step_histogram[lane, ti.min(j, ti.static(self.max_march_steps))] += 1
         return [ti.min(divergence_dist, dist_marched), closest_obj]
 
     @ti.func
-    def sdf_normal(self, p):
-        d = 1e-3
-        n = ti.Vector([0.0, 0.0, 0.0])
-        sdf_center, _ = self.scene.sdf(p)
-        for i in ti.static(range(3)):
-            inc = p
-            inc[i] += d
-            n[i] = (1 / d) * (self.scene.sdf(inc)[0] - sdf_center)
-        return n.normalized()
+    def _stats_lane(self, seed: ti.u32) -> int:
+        # Pixel seeds are hashed, so neighbouring threads count into different lanes
+        return ti.cast(seed % STATS_LANES, ti.i32)
+
+    @ti.func
+    def _march_relaxed(self, ray: Ray, t0: float, t1: float, max_march_steps: int):
+        # Enhanced sphere tracing, steps are over-relaxed by w until consecutive unbounding
+        # spheres stop overlapping, then the last step is undone and w is damped towards 1.
+        # Hits are accepted once the distance is small relative to the distance travelled
+        w = ti.cast(self.relaxation, ti.f32)
+        t = t0
+        step = 0.0
+        d = 0.0
+        best_err = np.inf
+        best_t = t0
+        best_obj = 0
+        j = 0
+        while j < max_march_steps and t < t1:
+            j += 1
+            last_d = d
+            d, obj = self.scene.sdf(ray.position + t * ray.direction)
+            if last_d + d < step:
+                step -= w * step
+                t += step
+                w = 0.5 * w + 0.5
+                continue
+            err = d / ti.max(t, 1e-6)
+            if err < best_err:
+                best_err, best_t, best_obj = err, t, obj
+            if err < ti.static(self.hit_tolerance):
+                break
+            step = w * d
+            t += step
+        if t >= t1:
+            best_t = t1
+        return best_t, best_obj, j
+
+    def render_stats(self) -> RenderStats:
+        """Counters of the most recent :meth:`render` or light curve, requires ``collect_stats=True``
+
+        :return: March steps, bounces, termination reasons, object hits and nan samples
+        :rtype: RenderStats
+        """
+        if not self.collect_stats:
+            raise ValueError(
+                "This RayMarchRenderer was initialized with collect_stats=False, it has no statistics"
+            )
+        counts = self._stats_counts.to_numpy().sum(axis=0)
+        return RenderStats(
+            rays=int(counts[_RAYS]),
+            march_steps=int(counts[_STEPS]),
+            step_histogram=self._step_histogram.to_numpy().sum(axis=0),
+            paths=int(counts[_PATHS]),
+            bounces=int(counts[_BOUNCES]),
+            terminations={r: int(c) for r, c in zip(TERMINATIONS, counts[_DIVERGED:])},
+            object_hits=self._object_hits.to_numpy().sum(axis=0)[: len(self.scene.objects)],
+            nan_count=int(counts[_NANS]),
+        )
+
+    def march_stats(self) -> dict:
+        """March step statistics for the most recent render, requires ``collect_stats=True``
+
+        :return: Number of marched rays, total steps and mean steps per ray
+        :rtype: dict
+        """
+        stats = self.render_stats()
+        return dict(rays=stats.rays, steps=stats.march_steps, mean_steps=stats.mean_steps)
+
+    def _reset_stats(self):
+        self._stats_counts.fill(0)
+        self._step_histogram.fill(0)
+        self._object_hits.fill(0)
+
+    @ti.func
+    def sdf_normal(self, p, obj: int):
+        return self.scene.object_normal(obj, p)
 
     def sum(self):
-        img = self.color_buffer.to_numpy()
-        if np.any(np.isnan(img)):
-            raise ValueError("A pixel in the image is nan, aborting!")
-        return img.sum() / self.samples_per_pixel
+        return self._power_sum[None] / self.samples_per_pixel
+
+    @property
+    def nan_count(self) -> int:
+        """Number of samples that produced nan power since the last :meth:`reset_buffer`, these are excluded from all sums"""
+        return int(self._nan_count[None])
 
     def total_brightness(self):
         return self.sum() * self.camera.fov**2 / self.res[1] ** 2
 
+    def _brightness_scale(self) -> float:
+        # Converts summed sample power into the units of total_brightness
+        return self.camera.fov**2 / self.res[1] ** 2 / self.samples_per_pixel
+
+    def brightness_estimate(self, confidence: float = 0.95) -> BrightnessEstimate:
+        """Mean brightness per :meth:`render` call since the last :meth:`reset_buffer`, treating each call as an independent batch
+
+        :param confidence: Confidence level of the interval, defaults to 0.95
+        :type confidence: float, optional
+        :return: Mean brightness with its standard error and confidence interval
+        :rtype: BrightnessEstimate
+        """
+        total, total_sq, n = self._batch_moments.to_numpy()
+        return BrightnessEstimate.from_moments(total, total_sq, n, confidence)
+
+    def render_to_precision(
+        self,
+        light_normal: ti.math.vec3,
+        rel_err: float = 0.01,
+        confidence: float = 0.95,
+        min_batches: int = 4,
+        max_batches: int = 1000,
+    ) -> BrightnessEstimate:
+        """Resets the buffer and renders until the brightness reaches a target relative standard error
+
+        :param light_normal: Direction the light travels
+        :type light_normal: ti.math.vec3
+        :param rel_err: Target standard error relative to the mean, defaults to 0.01
+        :type rel_err: float, optional
+        :param confidence: Confidence level of the returned interval, defaults to 0.95
+        :type confidence: float, optional
+        :param min_batches: Renders before stopping is allowed, defaults to 4
+        :type min_batches: int, optional
+        :param max_batches: Renders after which rendering stops regardless of the error, defaults to 1000
+        :type max_batches: int, optional
+        :return: Mean brightness per render with its standard error and confidence interval
+        :rtype: BrightnessEstimate
+        """
+        self.reset_buffer()
+        while True:
+            self.render(light_normal)
+            estimate = self.brightness_estimate(confidence)
+            if self._j >= max_batches or (
+                self._j >= min_batches and estimate.rel_err <= rel_err
+            ):
+                return estimate
+
     @ti.func
-    def next_hit(self, ray: Ray, divergence_dist: float, max_march_steps: int):
+    def next_hit(self, ray: Ray, divergence_dist: float, max_march_steps: int, lane: int):
         closest, normal = divergence_dist, ti.Vector.zero(ti.f32, 3)
         ray_march_dist, closest_obj = self.march(
-            ray, divergence_dist, max_march_steps
+            ray, divergence_dist, max_march_steps, lane
         )
         if ray_march_dist < divergence_dist and ray_march_dist < closest:
             closest = ray_march_dist
-            normal = self.sdf_normal(ray.position + ray.direction * closest)
+            normal = self.sdf_normal(ray.position + ray.direction * closest, closest_obj)
         return closest, normal, closest_obj
 
     def reset_buffer(self):
         self._j = 0
-        self._reset_buffer()
+        self._reset_buffer(1)
 
     @ti.kernel
-    def _reset_buffer(self):
-        for u, v in self.color_buffer:
-            self.color_buffer[u, v] = 0.0
+    def _reset_buffer(self, clear: int):
+        # precompile launches this with clear unset, which compiles it without touching the sums
+        if clear:
+            self._power_sum[None] = 0.0
+            self._nan_count[None] = 0
+            self._last_power_sum[None] = 0.0
+            for i in ti.static(range(3)):
+                self._batch_moments[i] = 0.0
+        if ti.static(self.store_image):
+            for u, v in self.color_buffer:
+                if clear:
+                    self.color_buffer[u, v] = 0.0
+
+    def save_state(self, path: str) -> None:
+        """Saves everything accumulated since the last :meth:`reset_buffer` to a ``.npz`` file
+
+        The state holds the image and brightness sums, the nan count, the batch moments, the number of
+        renders and the position of the sample stream, so a render resumed with :meth:`load_state` continues
+        exactly where this one stopped. The file is replaced atomically, so a preempted save leaves the
+        previous checkpoint intact.
+
+        :param path: Output path
+        :type path: str
+        """
+        tmp = f"{path}.tmp.npz"
+        np.savez(tmp, **self._state())
+        os.replace(tmp, path)
+
+    def load_state(self, path: str) -> None:
+        """Replaces the accumulated state with one written by :meth:`save_state`
+
+        :param path: Path of the saved state
+        :type path: str
+        """
+        with np.load(path) as state:
+            state = dict(state)
+        self._check_state(state)
+        self._j = int(state["renders"])
+        self._batch_seed = int(state["batch_seed"])
+        self._power_sum[None] = float(state["power_sum"])
+        self._last_power_sum[None] = float(state["power_sum"])
+        self._nan_count[None] = int(state["nan_count"])
+        self._batch_moments.from_numpy(state["batch_moments"])
+        if self.store_image:
+            self.color_buffer.from_numpy(state["color_buffer"])
+
+    def merge(self, other) -> None:
+        """Adds the accumulated state of another renderer of the same scene and image, so shards combine into one render
+
+        The other renderer must have drawn different samples, for instance by calling :meth:`set_seed` with
+        a different seed on each shard, otherwise the merged samples are duplicates.
+
+        :param other: Renderer, or path of a state written by :meth:`save_state`
+        :type other: RayMarchRenderer or str
+        """
+        if isinstance(other, RayMarchRenderer):
+            state = other._state()
+        else:
+            with np.load(other) as state:
+                state = dict(state)
+        self._check_state(state)
+        self._j += int(state["renders"])
+        self._power_sum[None] += float(state["power_sum"])
+        self._last_power_sum[None] += float(state["power_sum"])
+        self._nan_count[None] += int(state["nan_count"])
+        self._batch_moments.from_numpy(
+            self._batch_moments.to_numpy() + state["batch_moments"]
+        )
+        if self.store_image:
+            self.color_buffer.from_numpy(
+                self.color_buffer.to_numpy() + state["color_buffer"]
+            )
+
+    def _state(self) -> dict:
+        state = dict(
+            res=np.array(self.res),
+            samples_per_pixel=self.samples_per_pixel,
+            renders=self._j,
+            batch_seed=self._batch_seed,
+            power_sum=self._power_sum[None],
+            nan_count=self._nan_count[None],
+            batch_moments=self._batch_moments.to_numpy(),
+        )
+        if self.store_image:
+            state["color_buffer"] = self.color_buffer.to_numpy()
+        return state
+
+    def _check_state(self, state: dict) -> None:
+        if tuple(state["res"]) != self.res or int(state["samples_per_pixel"]) != self.samples_per_pixel:
+            raise ValueError(
+                f"The state was accumulated at resolution {tuple(state['res'])} with {int(state['samples_per_pixel'])} "
+                f"samples per pixel, this renderer uses {self.res} with {self.samples_per_pixel}"
+            )
+        if self.store_image and "color_buffer" not in state:
+            raise ValueError("The state has no image, it was saved with store_image=False")
 
     def render(self, light_normal: ti.math.vec3):
         self._j += 1
+        if self.collect_stats:
+            self._reset_stats()
         self._render(
+            *self.pixel_bounds(),
             light_normal,
             self.samples_per_pixel,
             self.max_bounces,
@@ -116,11 +483,31 @@ class RayMarchRenderer:
             self.camera.is_perspective,
             self.divergence_dist,
             self.max_march_steps,
+            self._brightness_scale(),
+            self._next_batch_seed(),
         )
 
+    def pixel_bounds(self) -> Tuple[int, int, int, int]:
+        """Pixels that :meth:`render` launches, the footprint of the scene's bounding sphere with ``clip_rays=True``
+
+        Camera rays of every other pixel miss the whole scene, so their power is zero.
+
+        :return: Pixel ranges ``(u0, u1, v0, v1)`` with exclusive upper bounds
+        :rtype: Tuple[int, int, int, int]
+        """
+        if not self.clip_rays:
+            return 0, self.res[0], 0, self.res[1]
+        if self.scene.bounding_sphere is None:
+            return 0, 0, 0, 0
+        return self.camera.footprint(*self.scene.bounding_sphere)
+
     @ti.kernel
     def _render(
         self,
+        u0: int,
+        u1: int,
+        v0: int,
+        v1: int,
         light_normal: ti.math.vec3,
         samples_per_pixel: int,
         max_bounces: int,
@@ -129,21 +516,352 @@ class RayMarchRenderer:
         is_perspective: bool,
         divergence_dist: float,
         max_march_steps: int,
+        batch_scale: ti.f64,
+        batch_seed: ti.u32,
     ):
         dcm = self.camera.orthonormalize()
 
-        for u, v in self.color_buffer:
-            ti.loop_config(serialize=False)  # Serializes the next for loop
-            for _ in range(samples_per_pixel):
-                ray = self.camera.init_ray(u, v, fov=fov, res=res, dcm=dcm, is_perspective=is_perspective)
-                ray = self.path_trace(
-                    ray,
-                    light_normal,
-                    max_bounces=max_bounces,
-                    divergence_dist=divergence_dist,
-                    max_march_steps=max_march_steps,
-                )
-                self.color_buffer[u, v] += ray.power
+        for u, v in ti.ndrange((u0, u1), (v0, v1)):
+            power = self._render_pixel(
+                u,
+                v,
+                light_normal,
+                samples_per_pixel,
+                max_bounces,
+                fov,
+                res,
+                is_perspective,
+                divergence_dist,
+                max_march_steps,
+                batch_seed,
+                dcm,
+                self.camera._pos(),
+                0,
+            )
+            if ti.static(self.store_image):
+                self.color_buffer[u, v] += power
+            self._power_sum[None] += power
+
+        # Runs after the pixel loop has finished
+        self._accumulate_batch(batch_scale)
+
+    @ti.func
+    def _render_pixel(
+        self,
+        u: int,
+        v: int,
+        light_normal: ti.math.vec3,
+        samples_per_pixel: int,
+        max_bounces: int,
+        fov: float,
+        res: ti.math.vec2,
+        is_perspective: bool,
+        divergence_dist: float,
+        max_march_steps: int,
+        batch_seed: ti.u32,
+        dcm: ti.math.mat3,
+        pos: ti.math.vec3,
+        epoch: int,
+    ) -> float:
+        """Power summed over the samples of pixel ``(u, v)``, whose sample stream depends only on the pixel, ``epoch`` and ``batch_seed``"""
+        power = 0.0
+        seed = pixel_seed(batch_seed, u, v, epoch)
+        ti.loop_config(serialize=False)  # Serializes the next for loop
+        for s in range(samples_per_pixel):
+            state = SamplerState(seed=seed, index=s, dim=0)
+            offset = self._uniform2(state)  # Position within the pixel
+            ray = self.camera.init_ray(u + offset.x, v + offset.y, pos=pos, fov=fov, res=res, dcm=dcm, is_perspective=is_perspective)
+            ray = self.path_trace(
+                ray,
+                light_normal,
+                max_bounces=max_bounces,
+                divergence_dist=divergence_dist,
+                max_march_steps=max_march_steps,
+                state=state,
+            )
+            power += self._valid_power(ray.power, seed)
+        return power
+
+    @ti.func
+    def _accumulate_batch(self, batch_scale: ti.f64):
+        # Adds the power summed since the last batch as one batch of brightness_estimate,
+        # zero-work launches pass a zero scale and are not a batch
+        if batch_scale > 0.0:
+            b = (self._power_sum[None] - self._last_power_sum[None]) * batch_scale
+            self._last_power_sum[None] = self._power_sum[None]
+            self._batch_moments[0] += b
+            self._batch_moments[1] += b * b
+            self._batch_moments[2] += 1
+
+    @ti.func
+    def _valid_power(self, power: float, seed: ti.u32) -> float:
+        if ti.math.isnan(power):
+            self._nan_count[None] += 1
+            if ti.static(self.collect_stats):
+                self._stats_counts[self._stats_lane(seed), _NANS] += 1
+            power = 0.0
+        return power
+
+    def render_trajectory(
+        self, light_normal: ti.math.vec3, frames: np.ndarray = None
+    ) -> np.ndarray:
+        """Renders the total brightness at many frames of the camera's trajectory in a single kernel launch
+
+        Poses are read on-device from :meth:`mirari.camera.Camera.set_trajectory`, so nothing is
+        transferred per frame. Renders do not add to the image or to :meth:`brightness_estimate`.
+
+        :param light_normal: Direction the light travels
+        :type light_normal: ti.math.vec3
+        :param frames: Frames to render, defaults to every frame of the trajectory
+        :type frames: np.ndarray [n,], optional
+        :return: Total brightness at each frame, normalized the same way as :meth:`total_brightness`
+        :rtype: np.ndarray [n,]
+        """
+        if frames is None:
+            frames = np.arange(self.camera.n_frames)
+        frames = np.ascontiguousarray(frames, dtype=np.int32).reshape(-1)
+        if frames.size and (frames.min() < 0 or frames.max() >= self.camera.n_frames):
+            raise ValueError(f"Frames must be in [0, {self.camera.n_frames})")
+        brightness = ti.ndarray(dtype=ti.f64, shape=frames.size)
+        if self.collect_stats:
+            self._reset_stats()
+        self._render_trajectory(
+            frames,
+            brightness,
+            light_normal,
+            self.samples_per_pixel,
+            self.max_bounces,
+            self.camera.fov,
+            self.camera.res_vector,
+            self.camera.is_perspective,
+            self.divergence_dist,
+            self.max_march_steps,
+            self._next_batch_seed(),
+        )
+        return brightness.to_numpy() * self._brightness_scale()
+
+    @ti.kernel
+    def _render_trajectory(
+        self,
+        frames: ti.types.ndarray(dtype=ti.i32, ndim=1),
+        brightness: ti.types.ndarray(dtype=ti.f64, ndim=1),
+        light_normal: ti.math.vec3,
+        samples_per_pixel: int,
+        max_bounces: int,
+        fov: float,
+        res: ti.math.vec2,
+        is_perspective: bool,
+        divergence_dist: float,
+        max_march_steps: int,
+        batch_seed: ti.u32,
+    ):
+        for k, u, v in ti.ndrange(frames.shape[0], self.res[0], self.res[1]):
+            f = frames[k]
+            brightness[k] += self._render_pixel(
+                u,
+                v,
+                light_normal,
+                samples_per_pixel,
+                max_bounces,
+                fov,
+                res,
+                is_perspective,
+                divergence_dist,
+                max_march_steps,
+                batch_seed,
+                self.camera.frame_dcm(f),
+                self.camera.pos_field[f],
+                f,
+            )
+
+    def render_light_curve(
+        self,
+        light_dirs: np.ndarray,
+        observer_dirs: np.ndarray,
+        attitudes: np.ndarray = None,
+    ) -> np.ndarray:
+        """Renders the total brightness of the scene at many epochs in a single kernel launch
+
+        The camera is placed at its current distance from the origin along each observer direction,
+        looking back at the origin. Attitudes rotate the whole scene as a rigid body, which is
+        equivalent to rotating the light and observer into the body frame.
+
+        :param light_dirs: Direction the light travels at each epoch, in the same convention as ``light_normal`` in :meth:`render`
+        :type light_dirs: np.ndarray [nx3]
+        :param observer_dirs: Unit vectors from the origin towards the observer at each epoch
+        :type observer_dirs: np.ndarray [nx3]
+        :param attitudes: Rotation vectors of the scene at each epoch, defaults to no rotation
+        :type attitudes: np.ndarray [nx3], optional
+        :return: Total brightness at each epoch, normalized the same way as :meth:`total_brightness`
+        :rtype: np.ndarray [n,]
+        """
+        epochs = self._light_curve_inputs(light_dirs, observer_dirs, attitudes)
+        batch = ti.ndarray(dtype=ti.f64, shape=epochs[0].shape[0])
+        if self.collect_stats:
+            self._reset_stats()
+        self._render_light_curve_batch(
+            *epochs, np.arange(epochs[0].shape[0], dtype=np.int32), batch
+        )
+        return batch.to_numpy() * self._brightness_scale()
+
+    def render_light_curve_to_precision(
+        self,
+        light_dirs: np.ndarray,
+        observer_dirs: np.ndarray,
+        attitudes: np.ndarray = None,
+        rel_err: float = 0.01,
+        confidence: float = 0.95,
+        min_batches: int = 4,
+        max_batches: int = 100,
+    ) -> BrightnessEstimate:
+        """Renders batches of every epoch until each one's brightness reaches a target relative standard error
+
+        Each batch renders ``samples_per_pixel`` samples per pixel for the epochs that have not converged yet,
+        so easy epochs stop early. Batch means are accumulated on-device.
+
+        :param light_dirs: Direction the light travels at each epoch
+        :type light_dirs: np.ndarray [nx3]
+        :param observer_dirs: Unit vectors from the origin towards the observer at each epoch
+        :type observer_dirs: np.ndarray [nx3]
+        :param attitudes: Rotation vectors of the scene at each epoch, defaults to no rotation
+        :type attitudes: np.ndarray [nx3], optional
+        :param rel_err: Target standard error of each epoch relative to its mean, defaults to 0.01
+        :type rel_err: float, optional
+        :param confidence: Confidence level of the returned intervals, defaults to 0.95
+        :type confidence: float, optional
+        :param min_batches: Batches rendered before an epoch may stop, defaults to 4
+        :type min_batches: int, optional
+        :param max_batches: Batches after which an epoch stops regardless of its error, defaults to 100
+        :type max_batches: int, optional
+        :return: Brightness of each epoch with its standard error and confidence interval
+        :rtype: BrightnessEstimate
+        """
+        epochs = self._light_curve_inputs(light_dirs, observer_dirs, attitudes)
+        n = epochs[0].shape[0]
+        batch = ti.ndarray(dtype=ti.f64, shape=n)
+        moments = ti.ndarray(dtype=ti.f64, shape=(n, 3))
+        moments.fill(0.0)
+        active = np.arange(n, dtype=np.int32)
+        if self.collect_stats:
+            self._reset_stats()
+        while True:
+            batch.fill(0.0)
+            self._render_light_curve_batch(*epochs, active, batch)
+            self._accumulate_moments(active, batch, moments, self._brightness_scale())
+            m = moments.to_numpy()
+            estimate = BrightnessEstimate.from_moments(
+                m[:, 0], m[:, 1], m[:, 2], confidence
+            )
+            done = (m[:, 2] >= max_batches) | (
+                (m[:, 2] >= min_batches) & (estimate.rel_err <= rel_err)
+            )
+            active = np.flatnonzero(~done).astype(np.int32)
+            if not active.size:
+                return estimate
+
+    def _light_curve_inputs(
+        self, light_dirs: np.ndarray, observer_dirs: np.ndarray, attitudes: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        light_dirs = np.ascontiguousarray(light_dirs, dtype=np.float32).reshape(-1, 3)
+        observer_dirs = np.ascontiguousarray(observer_dirs, dtype=np.float32).reshape(
+            -1, 3
+        )
+        if attitudes is None:
+            attitudes = np.zeros_like(light_dirs)
+        attitudes = np.ascontiguousarray(attitudes, dtype=np.float32).reshape(-1, 3)
+        if not light_dirs.shape[0] == observer_dirs.shape[0] == attitudes.shape[0]:
+            raise ValueError(
+                "light_dirs, observer_dirs and attitudes must have the same number of epochs"
+            )
+        return light_dirs, observer_dirs, attitudes
+
+    def _render_light_curve_batch(
+        self,
+        light_dirs: np.ndarray,
+        observer_dirs: np.ndarray,
+        attitudes: np.ndarray,
+        active: np.ndarray,
+        batch: ti.Ndarray,
+        batch_seed: Optional[int] = None,
+    ) -> None:
+        # precompile passes its own seed so that compiling does not move the sample stream
+        if batch_seed is None:
+            batch_seed = self._next_batch_seed()
+        self._render_light_curve(
+            light_dirs,
+            observer_dirs,
+            attitudes,
+            active,
+            batch,
+            ti.math.vec3(*self.camera.up.to_numpy()),
+            float(np.linalg.norm(self.camera.pos.to_numpy())),
+            self.samples_per_pixel,
+            self.max_bounces,
+            self.camera.fov,
+            self.camera.res_vector,
+            self.camera.is_perspective,
+            self.divergence_dist,
+            self.max_march_steps,
+            batch_seed,
+        )
+
+    @ti.kernel
+    def _accumulate_moments(
+        self,
+        active: ti.types.ndarray(dtype=ti.i32, ndim=1),
+        batch: ti.types.ndarray(dtype=ti.f64, ndim=1),
+        moments: ti.types.ndarray(dtype=ti.f64, ndim=2),
+        scale: ti.f64,
+    ):
+        for k in active:
+            b = batch[active[k]] * scale
+            moments[active[k], 0] += b
+            moments[active[k], 1] += b * b
+            moments[active[k], 2] += 1
+
+    @ti.kernel
+    def _render_light_curve(
+        self,
+        light_dirs: ti.types.ndarray(dtype=ti.math.vec3, ndim=1),
+        observer_dirs: ti.types.ndarray(dtype=ti.math.vec3, ndim=1),
+        attitudes: ti.types.ndarray(dtype=ti.math.vec3, ndim=1),
+        active: ti.types.ndarray(dtype=ti.i32, ndim=1),
+        brightness: ti.types.ndarray(dtype=ti.f64, ndim=1),
+        camera_up: ti.math.vec3,
+        camera_dist: float,
+        samples_per_pixel: int,
+        max_bounces: int,
+        fov: float,
+        res: ti.math.vec2,
+        is_perspective: bool,
+        divergence_dist: float,
+        max_march_steps: int,
+        batch_seed: ti.u32,
+    ):
+        for k, u, v in ti.ndrange(active.shape[0], self.res[0], self.res[1]):
+            e = active[k]
+            # Rotating the observer and light into the body frame is the same as rotating the scene
+            world_to_body = attitude_dcm(attitudes[e])
+            observer_dir = world_to_body @ observer_dirs[e]
+            light_normal = world_to_body @ light_dirs[e]
+            dcm = look_dcm(-observer_dir, world_to_body @ camera_up)
+            pos = camera_dist * observer_dir
+            brightness[e] += self._render_pixel(
+                u,
+                v,
+                light_normal,
+                samples_per_pixel,
+                max_bounces,
+                fov,
+                res,
+                is_perspective,
+                divergence_dist,
+                max_march_steps,
+                batch_seed,
+                dcm,
+                pos,
+                e,
+            )
 
     @ti.func
     def path_trace(
@@ -153,57 +871,269 @@ class RayMarchRenderer:
         max_bounces: int,
         divergence_dist: float,
         max_march_steps: int,
+        state: ti.template(),
     ):
         depth = 0
-        last_surface_normal = light_normal
+        throughput = ray.power
+        radiance = 0.0
+        bsdf_pdf = 0.0  # Solid angle density of the last scattered direction, zero for camera rays
+        reason = _MAX_BOUNCES
+        lane = self._stats_lane(state.seed)
 
         ti.loop_config(serialize=False)
         while depth < max_bounces:
             closest, normal, closest_obj = self.next_hit(
-                ray, divergence_dist, max_march_steps
+                ray, divergence_dist, max_march_steps, lane
             )
             depth += 1
-            if depth == max_bounces:  # Then we hit no lights
-                ray.power = 0
-                break
             if closest == divergence_dist:  # Then we have diverged
-                # power *= rdot(last_surface_normal, -light_normal)
-                ray.power = 0
+                reason = _DIVERGED
                 break
             else:
-                if closest_obj.material.emmissive:  # If we've hit a light
-                    ray.power *= closest_obj.material.cs * rdot(-ray.direction, normal)
+                if ti.static(self.collect_stats):
+                    self._object_hits[lane, closest_obj] += 1
+                material = self.scene.materials[closest_obj]
+                if material.emmissive:  # If we've hit a light
+                    reason = _LIGHT
+                    radiance += throughput * self._emission(
+                        material, ray.direction, normal, closest, closest_obj, bsdf_pdf
+                    )
+                    break
+                if depth == max_bounces:  # Then no segments are left to reach a light
                     break
-                last_surface_normal = normal
                 hit_pos = ray.position + closest * ray.direction
-
                 wo = -ray.direction
 
-                wi = ti.math.vec3(0.0, 0.0, 0.0)
-                if (
-                    ti.random() < closest_obj.material.cs
-                ):  # Then we've reflected specularly
-                    wm = sample_ggx_micro_normal_world(
-                        normal, closest_obj.material.a**2
-                    )
-                    wi = reflect(wo, wm)
-                    refl = ggx_reflectance(
-                        wi,
-                        wo,
-                        normal,
-                        wm,
-                        closest_obj.material.cs,
-                        closest_obj.material.a**2,
-                    )
-                    ray.power *= refl
-                else:  # Then we've reflected diffusely
-                    wi = (normal + random_direction()).normalized()
-                    ray.power *= rdot(wi, normal)
-
-                dir = wi
-                pos = hit_pos + 1e-5 * dir
-                ray.position = pos
-                ray.direction = dir
-        if ti.math.isnan(ray.power):
-            ray.power = 0.0
+                radiance += throughput * self._direct(
+                    hit_pos, normal, wo, material, light_normal, divergence_dist, max_march_steps, state
+                )
+                wi, weight, bsdf_pdf = self._scatter(material, normal, wo, state)
+                throughput *= weight
+                survived, throughput = self._roulette(depth, throughput, state)
+                if not survived:
+                    reason = _ROULETTE
+                    break
+
+                ray.position = hit_pos + 1e-5 * wi
+                ray.direction = wi
+        if ti.static(self.collect_stats):
+            self._count_path(lane, depth, reason)
+        ray.power = radiance
         return ray
+
+    @ti.func
+    def _emission(
+        self,
+        material,
+        ray_dir: ti.math.vec3,
+        normal: ti.math.vec3,
+        dist: float,
+        obj: int,
+        bsdf_pdf: float,
+    ) -> float:
+        """Light emitted back along ``ray_dir`` by the emissive object ``obj``, MIS weighted against the light samples of the previous bounce"""
+        cos_light = rdot(-ray_dir, normal)
+        weight = 1.0
+        if ti.static(self.light_sampling):
+            if bsdf_pdf > 0.0:
+                light_pdf = (
+                    self.scene.emitter_pdf(obj) * dist**2 / ti.max(cos_light, 1e-6)
+                )
+                weight = bsdf_pdf**2 / (bsdf_pdf**2 + light_pdf**2)
+        return weight * material.cs * cos_light
+
+    @ti.func
+    def _direct(
+        self,
+        hit_pos: ti.math.vec3,
+        normal: ti.math.vec3,
+        wo: ti.math.vec3,
+        material,
+        light_normal: ti.math.vec3,
+        divergence_dist: float,
+        max_march_steps: int,
+        state: ti.template(),
+    ) -> float:
+        """Direct light estimates at a path vertex from every enabled light sampling strategy"""
+        radiance = 0.0
+        if ti.static(self.light_sampling):
+            radiance += self.sample_light(
+                hit_pos, normal, wo, material, divergence_dist, max_march_steps, state
+            )
+        if ti.static(self.directional_light):
+            radiance += self.sample_sun(
+                hit_pos, normal, wo, material, light_normal, divergence_dist, max_march_steps, state
+            )
+        return radiance
+
+    @ti.func
+    def _scatter(self, material, normal: ti.math.vec3, wo: ti.math.vec3, state: ti.template()):
+        """Samples the next direction of a path from the specular/diffuse mixture
+
+        Returns the direction, the factor the throughput is multiplied by and the solid angle density
+        of the direction, which is only computed when light sampling needs it for MIS.
+        """
+        wi = ti.math.vec3(0.0, 0.0, 0.0)
+        weight = 0.0
+        pdf = 0.0
+        # Both lobes draw from the same dimensions, so every sample of a pixel stays aligned
+        lobe = self._uniform(state)
+        e = self._uniform2(state)
+        if lobe < material.cs:  # Then we've reflected specularly
+            wm = ggx_micro_normal_world(normal, material.a**2, e.x, e.y)
+            wi = reflect(wo, wm)
+            weight = ggx_reflectance(wi, wo, normal, wm, material.cs, material.a**2)
+        else:  # Then we've reflected diffusely
+            wi = (normal + sphere_direction(e.x, e.y)).normalized()
+            weight = rdot(wi, normal)
+        if ti.static(self.light_sampling):
+            pdf = self.bsdf_pdf(material, wo, wi, normal)
+        return wi, weight, pdf
+
+    @ti.func
+    def _roulette(self, depth: int, throughput: float, state: ti.template()):
+        """Randomly ends paths past ``min_bounces`` with probability one minus their throughput, returning whether the path survived and its reweighted throughput"""
+        survived = True
+        if ti.static(self.russian_roulette):
+            if depth >= ti.static(self.min_bounces):
+                survival = ti.min(throughput, 1.0)
+                if self._uniform(state) >= survival:
+                    survived = False
+                else:
+                    throughput /= survival
+        return survived, throughput
+
+    @ti.func
+    def _count_path(self, lane: int, depth: int, reason: int):
+        self._stats_counts[lane, _PATHS] += 1
+        bounces = depth
+        if reason == _DIVERGED:  # The last segment hit nothing
+            bounces -= 1
+        self._stats_counts[lane, _BOUNCES] += bounces
+        self._stats_counts[lane, reason] += 1
+
+    @ti.func
+    def bsdf_eval(self, material, wo: ti.math.vec3, wi: ti.math.vec3, normal: ti.math.vec3) -> float:
+        """BRDF times ``dot(normal, wi)`` for the specular/diffuse mixture sampled in :meth:`path_trace`"""
+        p_spec = ti.math.clamp(material.cs, 0.0, 1.0)
+        return p_spec * ggx_eval(wi, wo, normal, material.cs, material.a**2) + (
+            1 - p_spec
+        ) * diffuse_eval(wi, normal)
+
+    @ti.func
+    def bsdf_pdf(self, material, wo: ti.math.vec3, wi: ti.math.vec3, normal: ti.math.vec3) -> float:
+        """Solid angle density of ``wi`` under the specular/diffuse mixture sampled in :meth:`path_trace`"""
+        p_spec = ti.math.clamp(material.cs, 0.0, 1.0)
+        return p_spec * ggx_pdf(wi, wo, normal, material.a**2) + (
+            1 - p_spec
+        ) * diffuse_pdf(wi, normal)
+
+    @ti.func
+    def sample_light(
+        self,
+        hit_pos: ti.math.vec3,
+        normal: ti.math.vec3,
+        wo: ti.math.vec3,
+        material,
+        divergence_dist: float,
+        max_march_steps: int,
+        state: ti.template(),
+    ) -> float:
+        """Next event estimate of the light reaching ``hit_pos`` from a point sampled on an emissive object, MIS weighted against BSDF sampling"""
+        contribution = 0.0
+        e0 = self._uniform(state)
+        e = self._uniform2(state)
+        e3 = self._uniform(state)
+        p, n, light_obj, area_pdf = self.scene.sample_emitter(e0, e.x, e.y, e3)
+        origin = hit_pos + 1e-4 * normal
+        to_light = p - origin
+        dist = to_light.norm()
+        wi = to_light / dist
+        cos_light = -ti.math.dot(wi, n)
+        f = self.bsdf_eval(material, wo, wi, normal)
+        if area_pdf > 0.0 and cos_light > 0.0 and f > 0.0:
+            shadow_ray = Ray(position=origin, direction=wi, power=1.0)
+            t, obj = self.march(
+                shadow_ray, ti.min(dist * 1.01, divergence_dist), max_march_steps, self._stats_lane(state.seed)
+            )
+            if obj == light_obj and t > dist - 1e-3 * dist - 1e-4:
+                light_pdf = area_pdf * dist**2 / cos_light
+                bsdf_pdf = self.bsdf_pdf(material, wo, wi, normal)
+                weight = light_pdf**2 / (light_pdf**2 + bsdf_pdf**2)
+                le = self.scene.materials[light_obj].cs * cos_light
+                contribution = f * le * weight / light_pdf
+        return contribution
+
+    @ti.func
+    def sample_sun(
+        self,
+        hit_pos: ti.math.vec3,
+        normal: ti.math.vec3,
+        wo: ti.math.vec3,
+        material,
+        light_normal: ti.math.vec3,
+        divergence_dist: float,
+        max_march_steps: int,
+        state: ti.template(),
+    ) -> float:
+        """Direct estimate of the sunlight reaching ``hit_pos``, marching one shadow ray towards the sun
+
+        With a nonzero ``sun_angular_radius`` the shadow ray is aimed at a uniformly sampled point on
+        the solar disk, which averages to a soft penumbra over many samples.
+        """
+        contribution = 0.0
+        wi = -light_normal.normalized()
+        if ti.static(self.sun_angular_radius > 0):
+            e = self._uniform2(state)
+            wi = cone_direction(wi, ti.static(np.cos(self.sun_angular_radius)), e.x, e.y)
+        f = self.bsdf_eval(material, wo, wi, normal)
+        if ti.math.dot(wi, normal) > 0.0 and f > 0.0:
+            shadow_ray = Ray(position=hit_pos + 1e-4 * normal, direction=wi, power=1.0)
+            t, _ = self.march(shadow_ray, divergence_dist, max_march_steps, self._stats_lane(state.seed))
+            if t >= divergence_dist:
+                contribution = f * ti.static(self.sun_irradiance)
+        return contribution
+
+    def set_seed(self, seed: int) -> None:
+        """Selects the sample stream of later renders, renderers with different seeds draw independent samples
+
+        The seed is hashed to the starting batch, so streams of different seeds only overlap if billions
+        of batches are rendered.
+
+        :param seed: Non-negative seed
+        :type seed: int
+        """
+        if seed < 0:
+            raise ValueError(f"seed must be non-negative, got {seed}")
+        # splitmix64 finalizer
+        mask = 2**64 - 1
+        z = (seed + 0x9E3779B97F4A7C15) & mask
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & mask
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & mask
+        self._batch_seed = (z ^ (z >> 31)) % 2**32
+
+    def _next_batch_seed(self) -> int:
+        # Every kernel launch gets an independent scramble, so batches stay independent for error estimates
+        self._batch_seed = (self._batch_seed + 1) % 2**32
+        return self._batch_seed
+
+    @ti.func
+    def _uniform(self, state: ti.template()) -> float:
+        """Next uniform sample in [0, 1) of the path described by ``state``"""
+        e = 0.0
+        if ti.static(self.sampler == "sobol"):
+            e = sobol_1d(state)
+        else:
+            e = random_1d(state)
+        return e
+
+    @ti.func
+    def _uniform2(self, state: ti.template()) -> ti.math.vec2:
+        """Next pair of uniform samples in [0, 1) of the path described by ``state``"""
+        e = ti.math.vec2(0.0)
+        if ti.static(self.sampler == "sobol"):
+            e = sobol_2d_padded(state)
+        else:
+            e = random_2d(state)
+        return e
+
@@ -63,9 +63,23 @@ def random_n1_p1() -> float:
 
 @ti.func
 def random_direction() -> ti.math.vec3:
-    z = 2.0 * ti.random() - 1.0
-    a = ti.random() * 2.0 * np.pi
-    xy = ti.math.sqrt(1.0 - z * z) * ti.math.vec2(ti.math.sin(a), ti.math.cos(a))
+    return sphere_direction(ti.random(), ti.random())
+
+
+@ti.func
+def sphere_direction(e1: float, e2: float) -> ti.math.vec3:
+    """Maps a point in the unit square to a uniformly distributed direction
+
+    :param e1: Uniform sample in [0, 1)
+    :type e1: float
+    :param e2: Uniform sample in [0, 1)
+    :type e2: float
+    :return: Unit direction
+    :rtype: ti.math.vec3
+    """
+    z = 2.0 * e1 - 1.0
+    a = e2 * 2.0 * np.pi
+    xy = ti.math.sqrt(ti.max(1.0 - z * z, 0.0)) * ti.math.vec2(ti.math.sin(a), ti.math.cos(a))
     return ti.math.vec3(xy, z)
 
 
@@ -82,6 +96,32 @@ def random_hemisphere_direction(n) -> ti.math.vec3:
     return ax * (ti.cos(phi) * u + ti.sin(phi) * v) + ay * n
 
 
+@ti.func
+def cone_direction(n, cos_max: float, e1: float, e2: float) -> ti.math.vec3:
+    """Maps a point in the unit square to a uniformly distributed direction within a cone about ``n``
+
+    :param n: Unit axis of the cone
+    :type n: ti.math.vec3
+    :param cos_max: Cosine of the cone half-angle, 1 always returns ``n``
+    :type cos_max: float
+    :param e1: Uniform sample in [0, 1)
+    :type e1: float
+    :param e2: Uniform sample in [0, 1)
+    :type e2: float
+    :return: Unit direction
+    :rtype: ti.math.vec3
+    """
+    eps = 1e-4
+    u = ti.Vector([1.0, 0.0, 0.0])
+    if abs(n[1]) < 1 - eps:
+        u = n.cross(ti.Vector([0.0, 1.0, 0.0])).normalized()
+    v = n.cross(u)
+    phi = 2 * np.pi * e2
+    ay = 1 - e1 * (1 - cos_max)
+    ax = ti.sqrt(ti.max(1 - ay**2, 0.0))
+    return ax * (ti.cos(phi) * u + ti.sin(phi) * v) + ay * n
+
+
 @ti.func
 def lerp(v1: float, v2: float, t: float) -> ti.math.vec3:
     return (t * v2 + (1 - t) * v1).normalized()
@@ -93,7 +133,7 @@ def slerp(n1: ti.math.vec3, n2: ti.math.vec3, t: float) -> ti.math.vec3:
     return (ti.sin((1 - t) * om) * n1 + ti.sin(t * om) * n2) / ti.sin(om)
 
 
-@ti.func
+@ti.pyfunc
 def rv_to_dcm(rv) -> ti.math.mat3:
     theta = rv.norm()
     c = ti.cos(theta)
@@ -116,6 +156,21 @@ def rv_to_dcm(rv) -> ti.math.mat3:
     )
 
 
+@ti.pyfunc
+def attitude_dcm(rv) -> ti.math.mat3:
+    """Rotation matrix taking world frame vectors into the body frame of an object
+
+    :param rv: Rotation vector of the object's attitude, zero for no rotation
+    :type rv: ti.math.vec3
+    :return: World to body rotation matrix
+    :rtype: ti.math.mat3
+    """
+    dcm = ti.math.mat3(1, 0, 0, 0, 1, 0, 0, 0, 1)
+    if rv.norm() > 0.0:
+        dcm = rv_to_dcm(-rv)
+    return dcm
+
+
 @ti.func
 def rdot(v1: ti.math.vec3, v2: ti.math.vec3) -> float:
     dp = ti.math.dot(v1, v2)
@@ -0,0 +1,530 @@
+import os
+from typing import List, Tuple
+
+import numpy as np
+import taichi as ti
+
+from .bvh import BVHNode, build_sphere_bvh
+
+
+@ti.dataclass
+class Triangle:
+    a: ti.math.vec3
+    b: ti.math.vec3
+    c: ti.math.vec3
+    n: ti.math.vec3  # Unit face normal
+    # Angle-weighted pseudo-normals of the vertices and edges, which give the sign of the
+    # distance to points whose nearest feature is a vertex or an edge
+    na: ti.math.vec3
+    nb: ti.math.vec3
+    nc: ti.math.vec3
+    nab: ti.math.vec3
+    nbc: ti.math.vec3
+    nca: ti.math.vec3
+
+
+_PLY_TYPES = {
+    "char": "i1",
+    "int8": "i1",
+    "uchar": "u1",
+    "uint8": "u1",
+    "short": "i2",
+    "int16": "i2",
+    "ushort": "u2",
+    "uint16": "u2",
+    "int": "i4",
+    "int32": "i4",
+    "uint": "u4",
+    "uint32": "u4",
+    "float": "f4",
+    "float32": "f4",
+    "double": "f8",
+    "float64": "f8",
+}
+
+
+def _normalized(v: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(v, axis=-1, keepdims=True)
+    return np.divide(v, norm, out=np.zeros_like(v), where=norm > 0)
+
+
+def _triangulate(polygons: List[np.ndarray]) -> np.ndarray:
+    # Splits each polygon into a fan of triangles around its first vertex
+    if isinstance(polygons, np.ndarray):  # Every polygon has the same number of vertices
+        k = np.arange(1, polygons.shape[1] - 1)
+        fans = np.stack([np.broadcast_to(polygons[:, :1], (polygons.shape[0], k.size)), polygons[:, k], polygons[:, k + 1]], axis=-1)
+        return fans.reshape(-1, 3).astype(np.int64)
+    triangles = [
+        (p[0], p[k], p[k + 1]) for p in polygons for k in range(1, len(p) - 1)
+    ]
+    return np.array(triangles, dtype=np.int64).reshape(-1, 3)
+
+
+def read_obj(path: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Reads the vertices and faces of a Wavefront OBJ file, polygons are split into triangles
+
+    :param path: Path of the file
+    :type path: str
+    :return: Vertices and the vertex indices of each triangle
+    :rtype: Tuple[np.ndarray [nx3], np.ndarray [mx3]]
+    """
+    vertices = []
+    polygons = []
+    with open(path) as f:
+        for line in f:
+            words = line.split()
+            if not words:
+                continue
+            if words[0] == "v":
+                vertices.append([float(x) for x in words[1:4]])
+            elif words[0] == "f":
+                # Indices start at one, negative indices count back from the last vertex
+                idx = [int(w.split("/")[0]) for w in words[1:]]
+                polygons.append([i - 1 if i > 0 else len(vertices) + i for i in idx])
+    return np.array(vertices, dtype=np.float64).reshape(-1, 3), _triangulate(polygons)
+
+
+def read_ply(path: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Reads the vertices and faces of an ASCII or binary PLY file, polygons are split into triangles
+
+    :param path: Path of the file
+    :type path: str
+    :return: Vertices and the vertex indices of each triangle
+    :rtype: Tuple[np.ndarray [nx3], np.ndarray [mx3]]
+    """
+    with open(path, "rb") as f:
+        if f.readline().strip() != b"ply":
+            raise ValueError(f"{path} is not a PLY file")
+        fmt = None
+        elements = []  # Name, count and properties, list properties have a (count, item) type pair
+        while True:
+            line = f.readline()
+            if not line:
+                raise ValueError(f"The header of {path} has no end_header")
+            words = line.decode("ascii").split()
+            if not words:
+                continue
+            if words[0] == "format":
+                fmt = words[1]
+            elif words[0] == "element":
+                elements.append((words[1], int(words[2]), []))
+            elif words[0] == "property":
+                if words[1] == "list":
+                    elements[-1][2].append(
+                        (words[4], (_PLY_TYPES[words[2]], _PLY_TYPES[words[3]]))
+                    )
+                else:
+                    elements[-1][2].append((words[2], _PLY_TYPES[words[1]]))
+            elif words[0] == "end_header":
+                break
+        data = f.read()
+
+    if fmt == "ascii":
+        read = _read_ply_ascii
+    elif fmt in ("binary_little_endian", "binary_big_endian"):
+        read = _read_ply_binary
+    else:
+        raise ValueError(f"Unsupported PLY format {fmt!r} in {path}")
+    read_elements = read(data, elements, "<" if fmt == "binary_little_endian" else ">")
+    if "vertex" not in read_elements or "face" not in read_elements:
+        raise ValueError(f"{path} needs vertex and face elements")
+    vertex = read_elements["vertex"]
+    vertices = np.stack([vertex["x"], vertex["y"], vertex["z"]], axis=-1).astype(np.float64)
+    face = read_elements["face"]
+    polygons = face.get("vertex_indices", face.get("vertex_index"))
+    if polygons is None:
+        raise ValueError(f"The faces of {path} have no vertex_indices property")
+    return vertices, _triangulate(polygons)
+
+
+def _read_ply_ascii(data: bytes, elements: list, endian: str) -> dict:
+    tokens = data.split()
+    pos = 0
+    out = {}
+    for name, count, props in elements:
+        if all(not isinstance(t, tuple) for _, t in props):
+            block = np.array(tokens[pos : pos + count * len(props)], dtype=np.float64)
+            block = block.reshape(count, len(props))
+            pos += count * len(props)
+            out[name] = {p: block[:, i] for i, (p, _) in enumerate(props)}
+            continue
+        columns = {p: [] for p, _ in props}
+        for _ in range(count):
+            for p, t in props:
+                if isinstance(t, tuple):
+                    n = int(tokens[pos])
+                    columns[p].append(np.array(tokens[pos + 1 : pos + 1 + n], dtype=np.int64))
+                    pos += 1 + n
+                else:
+                    columns[p].append(float(tokens[pos]))
+                    pos += 1
+        out[name] = columns
+    return out
+
+
+def _read_ply_binary(data: bytes, elements: list, endian: str) -> dict:
+    pos = 0
+    out = {}
+    for name, count, props in elements:
+        lists = [(p, t) for p, t in props if isinstance(t, tuple)]
+        if not lists:
+            dtype = np.dtype([(p, endian + t) for p, t in props])
+            block = np.frombuffer(data, dtype=dtype, count=count, offset=pos)
+            pos += count * dtype.itemsize
+            out[name] = {p: block[p] for p, _ in props}
+            continue
+        # Faces are usually all triangles or all quads, which read as one structured block
+        block = None
+        if len(lists) == 1 and count:
+            n = int(
+                np.frombuffer(
+                    data,
+                    dtype=endian + lists[0][1][0],
+                    count=1,
+                    offset=pos + sum(np.dtype(t).itemsize for p, t in props[: props.index(lists[0])]),
+                )[0]
+            )
+            fields = []
+            for p, t in props:
+                if isinstance(t, tuple):
+                    fields += [(p + "_n", endian + t[0]), (p, endian + t[1], (n,))]
+                else:
+                    fields.append((p, endian + t))
+            dtype = np.dtype(fields)
+            if pos + count * dtype.itemsize <= len(data):
+                block = np.frombuffer(data, dtype=dtype, count=count, offset=pos)
+                if not np.all(block[lists[0][0] + "_n"] == n):
+                    block = None
+        if block is not None:
+            pos += count * block.dtype.itemsize
+            out[name] = {p: block[p] for p, _ in props}
+            continue
+        columns = {p: [] for p, _ in props}
+        for _ in range(count):
+            for p, t in props:
+                if isinstance(t, tuple):
+                    size = np.dtype(t[0]).itemsize
+                    n = int(np.frombuffer(data, dtype=endian + t[0], count=1, offset=pos)[0])
+                    columns[p].append(np.frombuffer(data, dtype=endian + t[1], count=n, offset=pos + size))
+                    pos += size + n * np.dtype(t[1]).itemsize
+                else:
+                    columns[p].append(np.frombuffer(data, dtype=endian + t, count=1, offset=pos)[0])
+                    pos += np.dtype(t).itemsize
+        out[name] = columns
+    return out
+
+
+class TriangleMesh:
+    def __init__(self, vertices: np.ndarray, faces: np.ndarray) -> None:
+        """A closed triangle mesh in body coordinates, placed in a scene by :class:`mirari.sdf.Mesh` objects
+
+        Distances to the mesh are signed with angle-weighted pseudo-normals, which is exact for
+        closed, consistently oriented meshes with outward facing triangles. Triangles with no area are dropped.
+
+        :param vertices: Vertex positions
+        :type vertices: np.ndarray [nx3]
+        :param faces: Vertex indices of each triangle, counterclockwise seen from outside
+        :type faces: np.ndarray [mx3]
+        """
+        self.vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+        faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+        if faces.size and (faces.min() < 0 or faces.max() >= self.vertices.shape[0]):
+            raise ValueError(f"Face indices must be in [0, {self.vertices.shape[0]})")
+        a, b, c = (self.vertices[faces[:, k]] for k in range(3))
+        keep = np.linalg.norm(np.cross(b - a, c - a), axis=-1) > 0
+        self.faces = faces[keep]
+        if not self.faces.size:
+            raise ValueError("The mesh has no triangles with nonzero area")
+
+    @classmethod
+    def load(cls, path: str) -> "TriangleMesh":
+        """Reads a mesh from an ``.obj`` or ``.ply`` file
+
+        :param path: Path of the file
+        :type path: str
+        :return: The mesh
+        :rtype: TriangleMesh
+        """
+        ext = os.path.splitext(path)[1].lower()
+        if ext == ".obj":
+            return cls(*read_obj(path))
+        if ext == ".ply":
+            return cls(*read_ply(path))
+        raise ValueError(f"Meshes can be loaded from .obj or .ply files, got {path}")
+
+    @property
+    def n_triangles(self) -> int:
+        return self.faces.shape[0]
+
+    def triangle_areas(self) -> np.ndarray:
+        a, b, c = (self.vertices[self.faces[:, k]] for k in range(3))
+        return 0.5 * np.linalg.norm(np.cross(b - a, c - a), axis=-1)
+
+    @property
+    def area(self) -> float:
+        return float(self.triangle_areas().sum())
+
+    @property
+    def extents(self) -> np.ndarray:
+        """Largest absolute coordinate of a vertex along each axis"""
+        return np.abs(self.vertices[np.unique(self.faces)]).max(axis=0)
+
+    def triangles(self) -> dict:
+        """Corners, normals and pseudo-normals of each triangle
+
+        :return: Arrays keyed by :class:`Triangle` member, suitable for ``Triangle.field.from_numpy``
+        :rtype: dict
+        """
+        f = self.faces
+        corners = [self.vertices[f[:, k]] for k in range(3)]
+        n = _normalized(np.cross(corners[1] - corners[0], corners[2] - corners[0]))
+
+        # Vertex pseudo-normals weight each face by its angle at the vertex
+        vertex_normals = np.zeros_like(self.vertices)
+        for k in range(3):
+            u = _normalized(corners[(k + 1) % 3] - corners[k])
+            w = _normalized(corners[(k + 2) % 3] - corners[k])
+            angle = np.arccos(np.clip((u * w).sum(axis=-1), -1.0, 1.0))
+            np.add.at(vertex_normals, f[:, k], angle[:, None] * n)
+        vertex_normals = _normalized(vertex_normals)
+
+        # Edge pseudo-normals are the sum of the normals of the faces sharing the edge
+        edges = np.sort(np.stack([f[:, [0, 1]], f[:, [1, 2]], f[:, [2, 0]]], axis=1).reshape(-1, 2), axis=1)
+        _, edge_index = np.unique(edges, axis=0, return_inverse=True)
+        edge_index = edge_index.reshape(-1)
+        edge_normals = np.zeros((edge_index.max() + 1, 3))
+        np.add.at(edge_normals, edge_index, np.repeat(n, 3, axis=0))
+        edge_normals = _normalized(edge_normals)[edge_index].reshape(-1, 3, 3)
+
+        arrays = dict(a=corners[0], b=corners[1], c=corners[2], n=n)
+        for k, name in enumerate(("na", "nb", "nc")):
+            arrays[name] = vertex_normals[f[:, k]]
+        for k, name in enumerate(("nab", "nbc", "nca")):
+            arrays[name] = edge_normals[:, k]
+        return {name: array.astype(np.float32) for name, array in arrays.items()}
+
+    def bvh(self) -> dict:
+        """Bounding sphere hierarchy over the triangles, see :func:`mirari.bvh.build_sphere_bvh`"""
+        corners = np.stack([self.vertices[self.faces[:, k]] for k in range(3)], axis=1)
+        centers = corners.mean(axis=1)
+        radii = np.linalg.norm(corners - centers[:, None], axis=-1).max(axis=1)
+        return build_sphere_bvh(centers, radii)
+
+
+@ti.func
+def closest_point_triangle(p: ti.math.vec3, tri: Triangle):
+    """Point of ``tri`` nearest to ``p`` and the pseudo-normal of the vertex, edge or face it lies on
+
+    Follows the Voronoi region tests of Ericson, Real-Time Collision Detection, section 5.1.5.
+    """
+    ab = tri.b - tri.a
+    ac = tri.c - tri.a
+    ap = p - tri.a
+    bp = p - tri.b
+    cp = p - tri.c
+    d1, d2 = ab.dot(ap), ac.dot(ap)
+    d3, d4 = ab.dot(bp), ac.dot(bp)
+    d5, d6 = ab.dot(cp), ac.dot(cp)
+    va = d3 * d6 - d5 * d4
+    vb = d5 * d2 - d1 * d6
+    vc = d1 * d4 - d3 * d2
+
+    q = tri.a
+    n = tri.na
+    if d1 <= 0.0 and d2 <= 0.0:
+        pass
+    elif d3 >= 0.0 and d4 <= d3:
+        q, n = tri.b, tri.nb
+    elif d6 >= 0.0 and d5 <= d6:
+        q, n = tri.c, tri.nc
+    elif vc <= 0.0 and d1 >= 0.0 and d3 <= 0.0:
+        q, n = tri.a + d1 / (d1 - d3) * ab, tri.nab
+    elif vb <= 0.0 and d2 >= 0.0 and d6 <= 0.0:
+        q, n = tri.a + d2 / (d2 - d6) * ac, tri.nca
+    elif va <= 0.0 and d4 - d3 >= 0.0 and d5 - d6 >= 0.0:
+        q, n = tri.b + (d4 - d3) / ((d4 - d3) + (d5 - d6)) * (tri.c - tri.b), tri.nbc
+    else:
+        denom = 1.0 / (va + vb + vc)
+        q, n = tri.a + ab * (vb * denom) + ac * (vc * denom), tri.n
+    return q, n
+
+
+@ti.data_oriented
+class MeshTables:
+    def __init__(self, meshes: List[TriangleMesh]) -> None:
+        """Triangles and bounding sphere hierarchies of a list of meshes, concatenated into shared fields
+
+        A :class:`mirari.scenes.Scene` holds one of these for the meshes its :class:`mirari.sdf.Mesh`
+        objects refer to. Distance queries walk the hierarchy of one mesh, skipping every subtree whose
+        bounding sphere is farther than the nearest triangle found so far.
+
+        :param meshes: Meshes, in the order :attr:`mirari.sdf.Mesh.mesh` indexes them
+        :type meshes: List[TriangleMesh]
+        """
+        self.meshes = list(meshes)
+        n = max(len(self.meshes), 1)
+        tris = [mesh.triangles() for mesh in self.meshes]
+        nodes = [mesh.bvh() for mesh in self.meshes]
+        tri_counts = np.array([mesh.n_triangles for mesh in self.meshes], dtype=np.int32)
+        node_counts = np.array([node["skip"].size for node in nodes], dtype=np.int32)
+
+        self._tris = Triangle.field(shape=max(int(tri_counts.sum()), 1))
+        self._tri_mesh = ti.field(dtype=ti.i32, shape=self._tris.shape)
+        # Cumulative area of the triangles of each mesh relative to its total, for sampling points by area
+        self._tri_cdf = ti.field(dtype=ti.f32, shape=self._tris.shape)
+        self._nodes = BVHNode.field(shape=max(int(node_counts.sum()), 1))
+        self._tri_start = ti.field(dtype=ti.i32, shape=n)
+        self._tri_count = ti.field(dtype=ti.i32, shape=n)
+        self._node_start = ti.field(dtype=ti.i32, shape=n)
+        self._node_count = ti.field(dtype=ti.i32, shape=n)
+        self.narrow_band = False
+
+        if self.meshes:
+            self._tris.from_numpy(
+                {k: np.concatenate([t[k] for t in tris]) for k in tris[0]}
+            )
+            self._nodes.from_numpy(
+                {k: np.concatenate([node[k] for node in nodes]) for k in nodes[0]}
+            )
+            self._tri_mesh.from_numpy(np.repeat(np.arange(len(self.meshes), dtype=np.int32), tri_counts))
+            cdf = [np.cumsum(mesh.triangle_areas()) / mesh.area for mesh in self.meshes]
+            self._tri_cdf.from_numpy(np.concatenate(cdf).astype(np.float32))
+            self._tri_start.from_numpy(np.concatenate([[0], np.cumsum(tri_counts)[:-1]]).astype(np.int32))
+            self._tri_count.from_numpy(tri_counts)
+            self._node_start.from_numpy(np.concatenate([[0], np.cumsum(node_counts)[:-1]]).astype(np.int32))
+            self._node_count.from_numpy(node_counts)
+
+    def build_narrow_band(self, resolution: int = 128, band: float = 2.0) -> None:
+        """Stores the nearest triangle at each node of a sparse grid around the surface of every mesh
+
+        Distance queries inside the band start from the triangle stored at the nearest node, so the
+        hierarchy walk culls almost every subtree immediately. Queries stay exact, outside the band they
+        walk the hierarchy as before. Grid blocks are only allocated near triangles, so memory grows with
+        the surface area rather than the volume. Must be called before any kernel using these tables is compiled.
+
+        :param resolution: Grid nodes along the longest axis of each mesh, defaults to 128
+        :type resolution: int, optional
+        :param band: Half width of the band in grid cells, defaults to 2.0
+        :type band: float, optional
+        """
+        if self.narrow_band:
+            raise ValueError("The narrow band has already been built")
+        pad = int(np.ceil(band))
+        if resolution <= 2 * pad + 1:
+            raise ValueError(f"resolution must be larger than {2 * pad + 1} for a band of {band} cells")
+        n = max(len(self.meshes), 1)
+        lo = np.zeros((n, 3), dtype=np.float32)
+        cell = np.ones(n, dtype=np.float32)
+        dims = np.ones((n, 3), dtype=np.int32)
+        for m, mesh in enumerate(self.meshes):
+            used = mesh.vertices[np.unique(mesh.faces)]
+            mesh_lo, mesh_hi = used.min(axis=0), used.max(axis=0)
+            cell[m] = max((mesh_hi - mesh_lo).max(), 1e-6) / (resolution - 1 - 2 * pad)
+            lo[m] = mesh_lo - pad * cell[m]
+            dims[m] = np.minimum(np.ceil((mesh_hi - mesh_lo) / cell[m]).astype(np.int32) + 2 * pad + 1, resolution)
+
+        self._grid_lo = ti.Vector.field(3, dtype=ti.f32, shape=n)
+        self._grid_cell = ti.field(dtype=ti.f32, shape=n)
+        self._grid_dims = ti.Vector.field(3, dtype=ti.i32, shape=n)
+        self._grid_lo.from_numpy(lo)
+        self._grid_cell.from_numpy(cell)
+        self._grid_dims.from_numpy(dims)
+        # Nearest triangle plus one at each node, inactive blocks read as zero
+        self._band_tri = ti.field(dtype=ti.i32)
+        blocks = -(-resolution // 8)
+        builder = ti.FieldsBuilder()
+        builder.pointer(ti.ijkl, (n, blocks, blocks, blocks)).dense(ti.ijkl, (1, 8, 8, 8)).place(self._band_tri)
+        self._band_tree = builder.finalize()
+
+        if self.meshes:
+            self._activate_band(band)
+            self._fill_band()
+        self.narrow_band = True
+
+    @ti.kernel
+    def _activate_band(self, band: float):
+        for t in self._tris:
+            m = self._tri_mesh[t]
+            tri = self._tris[t]
+            lo, cell, dims = self._grid_lo[m], self._grid_cell[m], self._grid_dims[m]
+            tri_lo = ti.min(tri.a, tri.b, tri.c)
+            tri_hi = ti.max(tri.a, tri.b, tri.c)
+            i0 = ti.max(ti.cast(ti.floor((tri_lo - lo) / cell - band), ti.i32), 0)
+            i1 = ti.min(ti.cast(ti.ceil((tri_hi - lo) / cell + band), ti.i32), dims - 1)
+            for i, j, k in ti.ndrange((i0.x, i1.x + 1), (i0.y, i1.y + 1), (i0.z, i1.z + 1)):
+                p = lo + cell * ti.math.vec3(i, j, k)
+                q, _ = closest_point_triangle(p, tri)
+                if (p - q).norm() <= band * cell:
+                    self._band_tri[m, i, j, k] = 0  # Writing activates the block
+
+    @ti.kernel
+    def _fill_band(self):
+        for m, i, j, k in self._band_tri:
+            p = self._grid_lo[m] + self._grid_cell[m] * ti.math.vec3(i, j, k)
+            t, _ = self._walk(m, p, -1, np.inf)
+            self._band_tri[m, i, j, k] = t + 1
+
+    @ti.func
+    def nearest(self, m: int, p: ti.math.vec3):
+        """Index of the triangle of mesh ``m`` nearest to ``p`` and the unsigned distance to it"""
+        best_tri = -1
+        best = np.inf
+        if ti.static(self.narrow_band):
+            g = ti.cast(ti.round((p - self._grid_lo[m]) / self._grid_cell[m]), ti.i32)
+            if (g >= 0).all() and (g < self._grid_dims[m]).all():
+                best_tri = self._band_tri[m, g.x, g.y, g.z] - 1
+            if best_tri >= 0:
+                q, _ = closest_point_triangle(p, self._tris[best_tri])
+                best = (p - q).norm()
+        return self._walk(m, p, best_tri, best)
+
+    @ti.func
+    def _walk(self, m: int, p: ti.math.vec3, best_tri: int, best: float):
+        # Same stackless preorder walk as Scene._bvh_sdf, within the nodes of mesh m
+        tri_start = self._tri_start[m]
+        node_start = self._node_start[m]
+        i = 0
+        while i < self._node_count[m]:
+            node = self._nodes[node_start + i]
+            if (p - node.center).norm() - node.radius < best:
+                if node.leaf >= 0:
+                    q, _ = closest_point_triangle(p, self._tris[tri_start + node.leaf])
+                    d = (p - q).norm()
+                    if d < best:
+                        best = d
+                        best_tri = tri_start + node.leaf
+                i += 1
+            else:
+                i = node.skip
+        return best_tri, best
+
+    @ti.func
+    def sdf(self, m: int, p: ti.math.vec3) -> float:
+        """Signed distance from body coordinates ``p`` to mesh ``m``, negative inside"""
+        t, d = self.nearest(m, p)
+        q, n = closest_point_triangle(p, self._tris[t])
+        return ti.select((p - q).dot(n) < 0.0, -d, d)
+
+    @ti.func
+    def normal(self, m: int, p: ti.math.vec3) -> ti.math.vec3:
+        """Outward pseudo-normal of the feature of mesh ``m`` nearest to ``p``, in body coordinates"""
+        t, _ = self.nearest(m, p)
+        _, n = closest_point_triangle(p, self._tris[t])
+        return n
+
+    @ti.func
+    def sample_surface(self, m: int, e1: float, e2: float, e3: float):
+        """Point sampled uniformly by area on mesh ``m`` and its face normal, in body coordinates"""
+        # Binary search for the first triangle whose cumulative area exceeds e1
+        lo = self._tri_start[m]
+        hi = lo + self._tri_count[m] - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._tri_cdf[mid] <= e1:
+                lo = mid + 1
+            else:
+                hi = mid
+        tri = self._tris[lo]
+        su = ti.sqrt(e2)
+        b0, b1 = 1 - su, e3 * su
+        return b0 * tri.a + b1 * tri.b + (1 - b0 - b1) * tri.c, tri.n
@@ -0,0 +1,238 @@
+import os
+from typing import Tuple
+
+import numpy as np
+
+from .parallel import LightCurvePool
+from .stats import BrightnessEstimate
+
+LIGHT_CURVE_DTYPE = np.dtype(
+    [
+        ("brightness", np.float64),
+        ("std_err", np.float64),
+        ("n_batches", np.int64),
+        ("n_samples", np.int64),  # Samples per pixel over every batch
+        ("written", np.bool_),
+    ]
+)
+
+
+def downsample(image: np.ndarray, factor: int) -> np.ndarray:
+    """Averages an image over square blocks of pixels, dropping rows and columns that do not fill a block
+
+    :param image: Image, such as ``RayMarchRenderer.color_buffer.to_numpy()``
+    :type image: np.ndarray [hxw] or [hxwx1]
+    :param factor: Side length of each block in pixels
+    :type factor: int
+    :return: Downsampled image
+    :rtype: np.ndarray [h//factor x w//factor]
+    """
+    image = np.asarray(image).reshape(image.shape[0], image.shape[1])
+    h, w = image.shape[0] // factor, image.shape[1] // factor
+    return image[: h * factor, : w * factor].reshape(h, factor, w, factor).mean(axis=(1, 3))
+
+
+class LightCurveWriter:
+    def __init__(
+        self,
+        path: str,
+        n_epochs: int,
+        image_shape: Tuple[int, int] = None,
+        resume: bool = True,
+    ) -> None:
+        """Memory-mapped on-disk light curve that is filled in as epochs are rendered
+
+        The directory at ``path`` holds ``light_curve.npy``, a structured array with one row of
+        :data:`LIGHT_CURVE_DTYPE` per epoch, and optionally ``images.npy``. Both are preallocated and
+        written in place, so memory use does not grow with the number of epochs and either file can be
+        opened with ``np.load(..., mmap_mode="r")`` while rendering is still running. An epoch's
+        ``written`` flag is only set after its data is flushed, so an interrupted run resumes at the
+        first epoch that was not fully written.
+
+        :param path: Output directory, created if needed
+        :type path: str
+        :param n_epochs: Number of epochs in the light curve
+        :type n_epochs: int
+        :param image_shape: Shape of the image stored with each epoch, defaults to no images
+        :type image_shape: Tuple[int, int], optional
+        :param resume: Whether to continue an existing output at ``path``, otherwise it is overwritten, defaults to True
+        :type resume: bool, optional
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        curve_path = os.path.join(path, "light_curve.npy")
+        image_path = os.path.join(path, "images.npy")
+        resume = resume and os.path.exists(curve_path)
+        if resume:
+            self.light_curve = np.load(curve_path, mmap_mode="r+")
+            if self.light_curve.dtype != LIGHT_CURVE_DTYPE or self.light_curve.shape != (n_epochs,):
+                raise ValueError(
+                    f"The light curve at {path} does not have {n_epochs} epochs in mirari's format, pass resume=False to overwrite it"
+                )
+        else:
+            self.light_curve = np.lib.format.open_memmap(
+                curve_path, mode="w+", dtype=LIGHT_CURVE_DTYPE, shape=(n_epochs,)
+            )
+            self.light_curve.flush()
+
+        self.images = None
+        if image_shape is not None:
+            image_shape = (n_epochs, *image_shape)
+            if resume and os.path.exists(image_path):
+                self.images = np.load(image_path, mmap_mode="r+")
+                if self.images.shape != image_shape:
+                    raise ValueError(
+                        f"The images at {path} have shape {self.images.shape[1:]}, not {image_shape[1:]}"
+                    )
+            else:
+                self.images = np.lib.format.open_memmap(
+                    image_path, mode="w+", dtype=np.float32, shape=image_shape
+                )
+
+    @property
+    def n_epochs(self) -> int:
+        return self.light_curve.shape[0]
+
+    @property
+    def next_epoch(self) -> int:
+        """First epoch that has not been written, equal to :attr:`n_epochs` once the light curve is complete"""
+        unwritten = np.flatnonzero(~self.light_curve["written"])
+        return int(unwritten[0]) if unwritten.size else self.n_epochs
+
+    def write(
+        self,
+        start: int,
+        estimate: BrightnessEstimate,
+        samples_per_pixel: int,
+        images: np.ndarray = None,
+    ) -> None:
+        """Writes the estimates of consecutive epochs and flushes them to disk
+
+        :param start: Index of the first epoch
+        :type start: int
+        :param estimate: Brightness of each epoch, scalar fields write a single epoch
+        :type estimate: BrightnessEstimate
+        :param samples_per_pixel: Samples per pixel of each batch
+        :type samples_per_pixel: int
+        :param images: Images of the epochs, required if the writer stores images
+        :type images: np.ndarray [nxhxw], optional
+        """
+        mean = np.atleast_1d(estimate.mean)
+        rows = slice(start, start + mean.size)
+        if rows.stop > self.n_epochs:
+            raise ValueError(
+                f"Epochs {start} to {rows.stop - 1} do not fit in a light curve of {self.n_epochs} epochs"
+            )
+        if self.images is not None:
+            if images is None:
+                raise ValueError("This writer stores images, pass the images of the epochs")
+            self.images[rows] = np.asarray(images).reshape(mean.size, *self.images.shape[1:])
+            self.images.flush()
+        n_batches = np.atleast_1d(estimate.n_batches)
+        self.light_curve["brightness"][rows] = mean
+        self.light_curve["std_err"][rows] = np.atleast_1d(estimate.std_err)
+        self.light_curve["n_batches"][rows] = n_batches
+        self.light_curve["n_samples"][rows] = n_batches * samples_per_pixel
+        self.light_curve.flush()
+        self.light_curve["written"][rows] = True
+        self.light_curve.flush()
+
+    def estimate(self, confidence: float = 0.95) -> BrightnessEstimate:
+        """Light curve written so far, unwritten epochs are zero
+
+        :param confidence: Confidence level of the intervals, defaults to 0.95
+        :type confidence: float, optional
+        :return: Brightness of each epoch with its standard error and confidence interval
+        :rtype: BrightnessEstimate
+        """
+        c = self.light_curve
+        estimate = BrightnessEstimate(
+            mean=np.array(c["brightness"]),
+            std_err=np.array(c["std_err"]),
+            ci_low=None,
+            ci_high=None,
+            n_batches=np.array(c["n_batches"]),
+            confidence=confidence,
+        )
+        return BrightnessEstimate.from_moments(*estimate.moments(), confidence)
+
+
+def stream_light_curve(
+    renderer,
+    writer: LightCurveWriter,
+    light_dirs: np.ndarray,
+    observer_dirs: np.ndarray,
+    attitudes: np.ndarray = None,
+    chunk_size: int = 1024,
+    rel_err: float = 0.01,
+    confidence: float = 0.95,
+    min_batches: int = 4,
+    max_batches: int = 100,
+    samples_per_pixel: int = None,
+) -> BrightnessEstimate:
+    """Renders a light curve in chunks of epochs, writing each chunk as soon as it finishes
+
+    Rendering starts at ``writer.next_epoch``, so calling this again after an interruption renders only
+    the epochs that are missing. Images are not rendered here, write them with :meth:`LightCurveWriter.write`.
+
+    :param renderer: Renders each chunk to precision
+    :type renderer: RayMarchRenderer or LightCurvePool
+    :param writer: Output of the light curve, with no images
+    :type writer: LightCurveWriter
+    :param light_dirs: Direction the light travels at each epoch
+    :type light_dirs: np.ndarray [nx3]
+    :param observer_dirs: Unit vectors from the origin towards the observer at each epoch
+    :type observer_dirs: np.ndarray [nx3]
+    :param attitudes: Rotation vectors of the scene at each epoch, defaults to no rotation
+    :type attitudes: np.ndarray [nx3], optional
+    :param chunk_size: Epochs rendered between writes, defaults to 1024
+    :type chunk_size: int, optional
+    :param rel_err: Target standard error of each epoch relative to its mean, defaults to 0.01
+    :type rel_err: float, optional
+    :param confidence: Confidence level of the returned intervals, defaults to 0.95
+    :type confidence: float, optional
+    :param min_batches: Batches rendered before an epoch may stop, defaults to 4
+    :type min_batches: int, optional
+    :param max_batches: Batches after which an epoch stops regardless of its error, defaults to 100
+    :type max_batches: int, optional
+    :param samples_per_pixel: Samples per pixel of each batch, defaults to ``renderer.samples_per_pixel``,
+        required for a :class:`mirari.parallel.LightCurvePool`
+    :type samples_per_pixel: int, optional
+    :return: The complete light curve
+    :rtype: BrightnessEstimate
+    """
+    if writer.images is not None:
+        raise ValueError("stream_light_curve does not render images, use a writer without image_shape")
+    light_dirs = np.asarray(light_dirs).reshape(-1, 3)
+    observer_dirs = np.asarray(observer_dirs).reshape(-1, 3)
+    if attitudes is None:
+        attitudes = np.zeros_like(light_dirs)
+    attitudes = np.asarray(attitudes).reshape(-1, 3)
+    if light_dirs.shape[0] != writer.n_epochs:
+        raise ValueError(
+            f"The writer holds {writer.n_epochs} epochs, but {light_dirs.shape[0]} were given"
+        )
+    if isinstance(renderer, LightCurvePool):
+        if samples_per_pixel is None:
+            raise ValueError("Pass the samples_per_pixel of the pool's renderers")
+        render = renderer.render_light_curve
+    else:
+        render = renderer.render_light_curve_to_precision
+        if samples_per_pixel is None:
+            samples_per_pixel = renderer.samples_per_pixel
+
+    start = writer.next_epoch
+    while start < writer.n_epochs:
+        chunk = slice(start, min(start + chunk_size, writer.n_epochs))
+        estimate = render(
+            light_dirs[chunk],
+            observer_dirs[chunk],
+            attitudes[chunk],
+            rel_err=rel_err,
+            confidence=confidence,
+            min_batches=min_batches,
+            max_batches=max_batches,
+        )
+        writer.write(start, estimate, samples_per_pixel)
+        start = writer.next_epoch
+    return writer.estimate(confidence)
@@ -0,0 +1,218 @@
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable
+
+import numpy as np
+
+from .stats import BrightnessEstimate
+
+# State of a worker process, set once by _init_worker
+_renderer = None
+
+
+def _init_worker(make_renderer: Callable, arch, cpu_threads: int) -> None:
+    from .runtime import init
+
+    init(arch=arch, cpu_threads=cpu_threads)
+    global _renderer
+    _renderer = make_renderer()
+
+
+def _render_epochs(
+    light_dirs: np.ndarray,
+    observer_dirs: np.ndarray,
+    attitudes: np.ndarray,
+    task_seed: int,
+    rel_err: float,
+    confidence: float,
+    min_batches: int,
+    max_batches: int,
+) -> BrightnessEstimate:
+    _renderer.set_seed(task_seed)
+    return _renderer.render_light_curve_to_precision(
+        light_dirs,
+        observer_dirs,
+        attitudes,
+        rel_err=rel_err,
+        confidence=confidence,
+        min_batches=min_batches,
+        max_batches=max_batches,
+    )
+
+
+class LightCurvePool:
+    def __init__(
+        self,
+        make_renderer: Callable,
+        n_workers: int = None,
+        cpu_threads: int = 1,
+        arch="cpu",
+        seed: int = 0,
+    ) -> None:
+        """A pool of worker processes that each own a Taichi runtime and a renderer
+
+        Work is split into tasks that each render with their own sample stream, and the batch
+        moments of the tasks are merged, so results do not depend on which worker ran which task.
+
+        :param make_renderer: Builds the :class:`mirari.march.RayMarchRenderer` of a worker, called once
+            per worker after its runtime is initialized. Must be picklable, so a module level function
+            or a ``functools.partial`` of one
+        :type make_renderer: Callable
+        :param n_workers: Number of worker processes, defaults to the number of cores divided by ``cpu_threads``
+        :type n_workers: int, optional
+        :param cpu_threads: Threads of each worker's runtime, defaults to 1
+        :type cpu_threads: int, optional
+        :param arch: Backend of each worker's runtime, see :func:`mirari.runtime.init`, defaults to ``cpu``
+        :type arch: optional
+        :param seed: Seed of the pool, pools with different seeds draw independent samples, defaults to 0
+        :type seed: int, optional
+        """
+        if n_workers is None:
+            n_workers = max((os.cpu_count() or 1) // cpu_threads, 1)
+        self.n_workers = n_workers
+        self.seed = seed
+        self._n_tasks = 0
+        # Forking a process with a live Taichi runtime is unsafe, so workers always start fresh
+        context = mp.get_context("spawn")
+        self._executor = ProcessPoolExecutor(
+            max_workers=n_workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(make_renderer, arch, cpu_threads),
+        )
+
+    def __enter__(self) -> "LightCurvePool":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Shuts down the worker processes"""
+        self._executor.shutdown()
+
+    def render_light_curve(
+        self,
+        light_dirs: np.ndarray,
+        observer_dirs: np.ndarray,
+        attitudes: np.ndarray = None,
+        rel_err: float = 0.01,
+        confidence: float = 0.95,
+        min_batches: int = 4,
+        max_batches: int = 100,
+        tasks_per_worker: int = 4,
+    ) -> BrightnessEstimate:
+        """Splits the epochs of a light curve across the workers, see :meth:`mirari.march.RayMarchRenderer.render_light_curve_to_precision`
+
+        :param light_dirs: Direction the light travels at each epoch
+        :type light_dirs: np.ndarray [nx3]
+        :param observer_dirs: Unit vectors from the origin towards the observer at each epoch
+        :type observer_dirs: np.ndarray [nx3]
+        :param attitudes: Rotation vectors of the scene at each epoch, defaults to no rotation
+        :type attitudes: np.ndarray [nx3], optional
+        :param rel_err: Target standard error of each epoch relative to its mean, defaults to 0.01
+        :type rel_err: float, optional
+        :param confidence: Confidence level of the returned intervals, defaults to 0.95
+        :type confidence: float, optional
+        :param min_batches: Batches rendered before an epoch may stop, defaults to 4
+        :type min_batches: int, optional
+        :param max_batches: Batches after which an epoch stops regardless of its error, defaults to 100
+        :type max_batches: int, optional
+        :param tasks_per_worker: Chunks of epochs per worker, more chunks balance epochs that converge at different rates, defaults to 4
+        :type tasks_per_worker: int, optional
+        :return: Brightness of each epoch with its standard error and confidence interval
+        :rtype: BrightnessEstimate
+        """
+        light_dirs = np.asarray(light_dirs, dtype=np.float32).reshape(-1, 3)
+        observer_dirs = np.asarray(observer_dirs, dtype=np.float32).reshape(-1, 3)
+        if attitudes is None:
+            attitudes = np.zeros_like(light_dirs)
+        attitudes = np.asarray(attitudes, dtype=np.float32).reshape(-1, 3)
+        if not light_dirs.shape[0] == observer_dirs.shape[0] == attitudes.shape[0]:
+            raise ValueError(
+                "light_dirs, observer_dirs and attitudes must have the same number of epochs"
+            )
+        n_tasks = min(self.n_workers * tasks_per_worker, light_dirs.shape[0])
+        chunks = np.array_split(np.arange(light_dirs.shape[0]), max(n_tasks, 1))
+        futures = [
+            self._submit(
+                light_dirs[c],
+                observer_dirs[c],
+                attitudes[c],
+                rel_err,
+                confidence,
+                min_batches,
+                max_batches,
+            )
+            for c in chunks
+        ]
+        moments = [np.concatenate(m) for m in zip(*(f.result().moments() for f in futures))]
+        return BrightnessEstimate.from_moments(*moments, confidence)
+
+    def render_epoch(
+        self,
+        light_dir: np.ndarray,
+        observer_dir: np.ndarray,
+        attitude: np.ndarray = None,
+        rel_err: float = 0.01,
+        confidence: float = 0.95,
+        min_batches: int = 4,
+        max_batches: int = 1000,
+    ) -> BrightnessEstimate:
+        """Splits the samples of one epoch across the workers, rendering rounds of batches until the merged estimate reaches a target relative standard error
+
+        :param light_dir: Direction the light travels
+        :type light_dir: np.ndarray [3,]
+        :param observer_dir: Unit vector from the origin towards the observer
+        :type observer_dir: np.ndarray [3,]
+        :param attitude: Rotation vector of the scene, defaults to no rotation
+        :type attitude: np.ndarray [3,], optional
+        :param rel_err: Target standard error relative to the mean, defaults to 0.01
+        :type rel_err: float, optional
+        :param confidence: Confidence level of the returned interval, defaults to 0.95
+        :type confidence: float, optional
+        :param min_batches: Batches rendered before stopping is allowed, defaults to 4
+        :type min_batches: int, optional
+        :param max_batches: Batches after which rendering stops regardless of the error, defaults to 1000
+        :type max_batches: int, optional
+        :return: Brightness with its standard error and confidence interval
+        :rtype: BrightnessEstimate
+        """
+        epoch = [np.asarray(x, dtype=np.float32).reshape(1, 3) for x in (light_dir, observer_dir)]
+        epoch.append(
+            np.zeros((1, 3), dtype=np.float32)
+            if attitude is None
+            else np.asarray(attitude, dtype=np.float32).reshape(1, 3)
+        )
+        # Each round gives every worker an equal share, at least enough to reach min_batches together
+        per_task = max(-(-min_batches // self.n_workers), 1)
+        estimates = []
+        while True:
+            futures = [
+                self._submit(*epoch, 0.0, confidence, per_task, per_task)
+                for _ in range(self.n_workers)
+            ]
+            estimates.extend(f.result() for f in futures)
+            estimate = BrightnessEstimate.merge(estimates, confidence)
+            n = int(estimate.n_batches[0])
+            if n >= max_batches or (n >= min_batches and estimate.rel_err[0] <= rel_err):
+                return BrightnessEstimate.from_moments(
+                    *(m[0] for m in estimate.moments()), confidence
+                )
+
+    def _submit(self, light_dirs, observer_dirs, attitudes, rel_err, confidence, min_batches, max_batches):
+        # Every task gets its own stream
+        task_seed = self.seed * 2**32 + self._n_tasks
+        self._n_tasks += 1
+        return self._executor.submit(
+            _render_epochs,
+            light_dirs,
+            observer_dirs,
+            attitudes,
+            task_seed,
+            rel_err,
+            confidence,
+            min_batches,
+            max_batches,
+        )
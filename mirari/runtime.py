@@ -0,0 +1,106 @@
+import os
+
+import taichi as ti
+from taichi.lang import impl
+
+# Compiled kernels are kept on disk between processes, keyed by their source and the
+# configuration baked into them, see RayMarchRenderer.precompile
+CACHE_DIR = os.environ.get(
+    "MIRARI_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "mirari")
+)
+
+_ARCHS = {
+    "gpu": ti.gpu,
+    "cpu": ti.cpu,
+    "cuda": ti.cuda,
+    "vulkan": ti.vulkan,
+    "metal": ti.metal,
+    "opengl": ti.opengl,
+    "x64": ti.x64,
+    "arm64": ti.arm64,
+}
+_FPS = {"f32": ti.f32, "f64": ti.f64}
+
+
+def init(
+    arch=None,
+    cpu_threads: int = None,
+    default_fp=None,
+    offline_cache: bool = None,
+    offline_cache_file_path: str = None,
+    random_seed: int = None,
+    **kwargs,
+) -> None:
+    """Initializes the Taichi runtime used by mirari
+
+    Calling this is optional, the first :class:`mirari.scenes.Scene`, :class:`mirari.camera.Camera` or
+    :class:`mirari.march.RayMarchRenderer` initializes the runtime with the defaults below, unless Taichi
+    was already initialized by the caller, in which case that runtime is used as is. Calling this again
+    starts a new runtime, so any existing scenes and renderers become invalid.
+
+    Each argument left as ``None`` is read from an environment variable, then falls back to a default.
+
+    :param arch: Backend, a Taichi arch or one of ``gpu``, ``cpu``, ``cuda``, ``vulkan``, ``metal``, ``opengl``,
+        ``x64`` or ``arm64``, from ``MIRARI_ARCH``, defaults to ``gpu``, which falls back to the CPU without one
+    :type arch: optional
+    :param cpu_threads: Threads used by CPU backends, from ``MIRARI_CPU_THREADS``, defaults to every core
+    :type cpu_threads: int, optional
+    :param default_fp: Precision of ``float`` in kernels, ``ti.f32``, ``ti.f64``, ``f32`` or ``f64``, from
+        ``MIRARI_DEFAULT_FP``, defaults to ``f32``
+    :type default_fp: optional
+    :param offline_cache: Whether compiled kernels are cached on disk, from ``MIRARI_OFFLINE_CACHE``, defaults to True
+    :type offline_cache: bool, optional
+    :param offline_cache_file_path: Directory of the kernel cache, defaults to ``mirari.CACHE_DIR``, which is
+        ``MIRARI_CACHE_DIR`` or ``~/.cache/mirari``
+    :type offline_cache_file_path: str, optional
+    :param random_seed: Seed of ``ti.random``, from ``MIRARI_RANDOM_SEED``, defaults to Taichi's default
+    :type random_seed: int, optional
+    :param kwargs: Passed on to ``ti.init``
+    """
+    arch = _lookup(_from_env(arch, "MIRARI_ARCH", "gpu"), _ARCHS, "arch")
+    default_fp = _lookup(_from_env(default_fp, "MIRARI_DEFAULT_FP", "f32"), _FPS, "default_fp")
+    cpu_threads = _from_env(cpu_threads, "MIRARI_CPU_THREADS", None)
+    if cpu_threads is not None:
+        kwargs["cpu_max_num_threads"] = int(cpu_threads)
+    random_seed = _from_env(random_seed, "MIRARI_RANDOM_SEED", None)
+    if random_seed is not None:
+        kwargs["random_seed"] = int(random_seed)
+    offline_cache = _from_env(offline_cache, "MIRARI_OFFLINE_CACHE", True)
+    if isinstance(offline_cache, str):
+        offline_cache = offline_cache.lower() not in ("0", "false", "no", "off")
+    ti.init(
+        arch=arch,
+        default_fp=default_fp,
+        offline_cache=offline_cache,
+        offline_cache_file_path=offline_cache_file_path or CACHE_DIR,
+        **kwargs,
+    )
+
+
+def is_initialized() -> bool:
+    """Whether a Taichi runtime exists, either from :func:`init` or from ``ti.init``
+
+    :return: True once kernels can be compiled and fields allocated
+    :rtype: bool
+    """
+    return impl.get_runtime().prog is not None
+
+
+def ensure_init() -> None:
+    """Initializes the runtime with :func:`init` defaults if nothing has initialized it yet"""
+    if not is_initialized():
+        init()
+
+
+def _from_env(value, name: str, default):
+    if value is not None:
+        return value
+    return os.environ.get(name, default)
+
+
+def _lookup(value, options: dict, name: str):
+    if not isinstance(value, str):
+        return value
+    if value.lower() not in options:
+        raise ValueError(f"{name} must be one of {sorted(options)}, got {value!r}")
+    return options[value.lower()]
@@ -0,0 +1,150 @@
+import taichi as ti
+
+# Owen-scrambled Sobol points following Burley, "Practical Hash-based Owen Scrambling" (2020).
+# Each dimension (or pair of dimensions) of a sample is padded from an independently shuffled and
+# scrambled copy of the first two Sobol dimensions, so any number of dimensions can be drawn.
+
+
+@ti.dataclass
+class SamplerState:
+    seed: ti.u32  # Hash of the pixel and batch, decorrelates the sequences of different pixels
+    index: ti.u32  # Index of the sample within the pixel
+    dim: ti.u32  # Next dimension to draw
+
+
+@ti.func
+def hash_u32(x: ti.u32) -> ti.u32:
+    """Avalanching integer hash (lowbias32)
+
+    :param x: Value to hash
+    :type x: ti.u32
+    :return: Hashed value
+    :rtype: ti.u32
+    """
+    x ^= x >> 16
+    x *= ti.u32(0x7FEB352D)
+    x ^= x >> 15
+    x *= ti.u32(0x846CA68B)
+    x ^= x >> 16
+    return x
+
+
+@ti.func
+def hash_combine(seed: ti.u32, v: ti.u32) -> ti.u32:
+    return hash_u32(seed ^ (v + ti.u32(0x9E3779B9) + (seed << 6) + (seed >> 2)))
+
+
+@ti.func
+def reverse_bits(x: ti.u32) -> ti.u32:
+    x = ((x >> 1) & ti.u32(0x55555555)) | ((x & ti.u32(0x55555555)) << 1)
+    x = ((x >> 2) & ti.u32(0x33333333)) | ((x & ti.u32(0x33333333)) << 2)
+    x = ((x >> 4) & ti.u32(0x0F0F0F0F)) | ((x & ti.u32(0x0F0F0F0F)) << 4)
+    x = ((x >> 8) & ti.u32(0x00FF00FF)) | ((x & ti.u32(0x00FF00FF)) << 8)
+    return (x >> 16) | (x << 16)
+
+
+@ti.func
+def owen_scramble(x: ti.u32, seed: ti.u32) -> ti.u32:
+    """Nested uniform scramble of the bits of ``x``, most significant first
+
+    :param x: Fixed point value in [0, 1) or a sample index
+    :type x: ti.u32
+    :param seed: Scramble seed
+    :type seed: ti.u32
+    :return: Scrambled value
+    :rtype: ti.u32
+    """
+    # Laine-Karras style permutation on the reversed bits, each bit only depends on less significant ones
+    x = reverse_bits(x)
+    x ^= x * ti.u32(0x3D20ADEA)
+    x += seed
+    x *= (seed >> 16) | ti.u32(1)
+    x ^= x * ti.u32(0x05526C56)
+    x ^= x * ti.u32(0x53A22864)
+    return reverse_bits(x)
+
+
+@ti.func
+def sobol_2d(index: ti.u32) -> ti.math.uvec2:
+    """First two dimensions of the Sobol sequence as 32 bit fixed point values
+
+    :param index: Index of the point
+    :type index: ti.u32
+    :return: Fixed point coordinates
+    :rtype: ti.math.uvec2
+    """
+    y = ti.u32(0)
+    v = ti.u32(1) << 31
+    i = index
+    while i != 0:
+        if (i & 1) != 0:
+            y ^= v
+        i >>= 1
+        v ^= v >> 1
+    return ti.math.uvec2(reverse_bits(index), y)
+
+
+@ti.func
+def to_unit_float(x: ti.u32) -> float:
+    # The top 24 bits fit exactly in a float and keep the result below 1
+    return ti.cast(x >> 8, ti.f32) * (1.0 / 16777216.0)
+
+
+@ti.func
+def pixel_seed(batch_seed: ti.u32, u: int, v: int, epoch: int) -> ti.u32:
+    """Seed of the sample sequence of one pixel in one batch
+
+    :param batch_seed: Seed of the batch, a new one gives an independent randomization
+    :type batch_seed: ti.u32
+    :param u: Pixel row
+    :type u: int
+    :param v: Pixel column
+    :type v: int
+    :param epoch: Light curve epoch, 0 for single images
+    :type epoch: int
+    :return: Seed for :class:`SamplerState`
+    :rtype: ti.u32
+    """
+    h = hash_combine(hash_u32(batch_seed), ti.cast(u, ti.u32))
+    h = hash_combine(h, ti.cast(v, ti.u32))
+    return hash_combine(h, ti.cast(epoch, ti.u32))
+
+
+@ti.func
+def sobol_1d(state: ti.template()) -> float:
+    """Draws the next dimension of the scrambled sequence and advances ``state``"""
+    h = hash_combine(state.seed, state.dim)
+    i = owen_scramble(state.index, hash_u32(h))
+    state.dim += 1
+    return to_unit_float(owen_scramble(reverse_bits(i), h))
+
+
+@ti.func
+def sobol_2d_padded(state: ti.template()) -> ti.math.vec2:
+    """Draws the next two dimensions of the scrambled sequence as a stratified pair and advances ``state``"""
+    h = hash_combine(state.seed, state.dim)
+    p = sobol_2d(owen_scramble(state.index, hash_u32(h)))
+    state.dim += 2
+    return ti.math.vec2(
+        to_unit_float(owen_scramble(p.x, hash_combine(h, 1))),
+        to_unit_float(owen_scramble(p.y, hash_combine(h, 2))),
+    )
+
+
+@ti.func
+def random_1d(state: ti.template()) -> float:
+    """Draws an independent uniform sample keyed by the seed, index and dimension of ``state`` and advances it
+
+    Unlike ``ti.random``, the stream is a pure function of the state, so it can be checkpointed and resumed.
+    """
+    x = hash_combine(hash_combine(state.seed, state.index), state.dim)
+    state.dim += 1
+    return to_unit_float(x)
+
+
+@ti.func
+def random_2d(state: ti.template()) -> ti.math.vec2:
+    """Draws two independent uniform samples, see :func:`random_1d`"""
+    e1 = random_1d(state)
+    e2 = random_1d(state)
+    return ti.math.vec2(e1, e2)
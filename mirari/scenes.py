@@ -1,7 +1,12 @@
 import taichi as ti
 from .sdf import *
+from .bvh import BVHNode, build_sphere_bvh
+from .mesh import MeshTables, TriangleMesh
+from .math import attitude_dcm
+from .runtime import ensure_init
 import numpy as np
-from typing import Callable
+import os
+from typing import Callable, Sequence
 
 
 @ti.func
@@ -17,28 +22,551 @@ def make_nested(f):
     return f
 
 
+# Primitive types a Scene can hold, an object's kind is its position in this tuple
+PRIMITIVES = (Box, Sphere, Torus, Mesh)
+# Meshes are answered from the scene's mesh tables rather than by the primitive itself
+MESH_KIND = PRIMITIVES.index(Mesh)
+# Primitives without an analytic normal_local take their normals from differences of their own SDF
+ANALYTIC_NORMALS = tuple("normal_local" in primitive.methods for primitive in PRIMITIVES)
+
+
+def primitive_kind(obj) -> int:
+    """Index of the type of ``obj`` in :data:`PRIMITIVES`
+
+    :param obj: Primitive from :mod:`mirari.sdf`
+    :type obj: Box, Sphere, Torus or Mesh
+    :return: Kind of the primitive
+    :rtype: int
+    """
+    name = getattr(obj, "kind", None)
+    if callable(name):
+        for kind, primitive in enumerate(PRIMITIVES):
+            if name() == primitive.methods["kind"](obj):
+                return kind
+    raise ValueError(f"Scenes can only hold primitives from mirari.sdf, got {obj!r}")
+
+
+@ti.func
+def _difference_normal(obj, q: ti.math.vec3) -> ti.math.vec3:
+    # Tetrahedral differences of the primitive's own SDF in its body frame
+    e = ti.math.vec2(1.0, -1.0) * 0.5773 * 1e-3
+    return (
+        e.xyy * obj.sdf_local(q + e.xyy)
+        + e.yyx * obj.sdf_local(q + e.yyx)
+        + e.yxy * obj.sdf_local(q + e.yxy)
+        + e.xxx * obj.sdf_local(q + e.xxx)
+    ).normalized()
+
+
+def _bounds_path(path: str) -> str:
+    # Sidecar of a grid saved by Scene.save_bake, holding its bounds and the box of the scene
+    return f"{os.path.splitext(path)[0]}_bounds.npy"
+
+
+def _fill_struct(arrays: dict, i: int, obj) -> None:
+    # Writes a Python scope struct into row i of the arrays from StructField.to_numpy
+    for name, array in arrays.items():
+        value = getattr(obj, name)
+        if isinstance(array, dict):
+            _fill_struct(array, i, value)
+        else:
+            array[i] = value.to_numpy() if hasattr(value, "to_numpy") else value
+
+
 @ti.data_oriented
 class Scene:
-    def __init__(self, objects: Callable):
-        self.objects = objects
-        self._n_objs = len(objects)
+    def __init__(
+        self,
+        objects: Callable,
+        bvh: bool = True,
+        capacity: int = None,
+        meshes: Sequence[TriangleMesh] = (),
+    ):
+        """A collection of SDF primitives
+
+        Objects are stored in one struct field per primitive type and looked up at runtime, so
+        objects can be added, removed or edited with :meth:`add`, :meth:`remove` and :meth:`update`
+        without recompiling any kernel that uses the scene.
+
+        :param objects: Tuple of primitives from :mod:`mirari.sdf`
+        :type objects: Callable
+        :param bvh: Whether to cull distance queries with a bounding sphere hierarchy over the objects,
+            otherwise every object is evaluated for every query, defaults to True
+        :type bvh: bool, optional
+        :param capacity: Most objects the scene can hold, defaults to twice the initial number of objects and at least 16
+        :type capacity: int, optional
+        :param meshes: Triangle meshes that :class:`mirari.sdf.Mesh` objects refer to by index, these are fixed once the scene is created
+        :type meshes: Sequence[TriangleMesh], optional
+        """
+        ensure_init()
+        self.objects = list(objects)
+        if capacity is None:
+            capacity = max(2 * len(self.objects), 16)
+        if capacity < len(self.objects):
+            raise ValueError(
+                f"capacity must be at least the number of objects, {len(self.objects)}"
+            )
+        self.capacity = capacity
+        self.use_bvh = bvh
+        self.meshes = list(meshes)
+        self._mesh_tables = MeshTables(self.meshes)
+
+        self._primitives = [primitive.field(shape=capacity) for primitive in PRIMITIVES]
+        self._kinds = ti.field(dtype=ti.i32, shape=capacity)
+        self._slots = ti.field(dtype=ti.i32, shape=capacity)  # Index of each object in its primitive field
+        self._n_objs = ti.field(dtype=ti.i32, shape=())
+        self.materials = Material.field(shape=capacity)
+
+        self._bvh = BVHNode.field(shape=2 * capacity - 1)
+        self._n_nodes = ti.field(dtype=ti.i32, shape=())
+
+        self._emitters = ti.field(dtype=ti.i32, shape=capacity)
+        self._n_emitters = ti.field(dtype=ti.i32, shape=())
+
+        self.baked = False
+        self._upload()
+
+    @property
+    def emitters(self) -> list:
+        """Indices of the emissive objects"""
+        return [i for i, obj in enumerate(self.objects) if obj.material.emmissive]
+
+    def add(self, obj) -> int:
+        """Adds an object to the scene
+
+        :param obj: Primitive from :mod:`mirari.sdf`
+        :type obj: Box, Sphere, Torus or Mesh
+        :return: Index of the new object
+        :rtype: int
+        """
+        if len(self.objects) == self.capacity:
+            raise ValueError(
+                f"This Scene is full, it was created with capacity={self.capacity}"
+            )
+        primitive_kind(obj)
+        self.objects.append(obj)
+        self._upload()
+        return len(self.objects) - 1
+
+    def remove(self, index: int) -> None:
+        """Removes the object at ``index``, later objects move down one index
+
+        :param index: Index of the object
+        :type index: int
+        """
+        self.objects.pop(index)
+        self._upload()
+
+    def update(self, index: int, obj) -> None:
+        """Replaces the object at ``index``, which may change its shape, size, position or material
+
+        :param index: Index of the object
+        :type index: int
+        :param obj: Primitive from :mod:`mirari.sdf`
+        :type obj: Box, Sphere, Torus or Mesh
+        """
+        primitive_kind(obj)
+        self.objects[index] = obj
+        self._upload()
+
+    def _upload(self) -> None:
+        # Rebuilds every table from self.objects with one transfer per field
+        kinds = np.zeros(self.capacity, dtype=np.int32)
+        slots = np.zeros(self.capacity, dtype=np.int32)
+        arrays = [field.to_numpy() for field in self._primitives]
+        counts = [0] * len(PRIMITIVES)
+        materials = self.materials.to_numpy()
+        for i, obj in enumerate(self.objects):
+            obj.set_attitude(obj.rv)
+            kind = primitive_kind(obj)
+            if kind == MESH_KIND:
+                self._fill_mesh_bounds(obj)
+            kinds[i], slots[i] = kind, counts[kind]
+            _fill_struct(arrays[kind], counts[kind], obj)
+            _fill_struct(materials, i, obj.material)
+            counts[kind] += 1
+        for field, array in zip(self._primitives, arrays):
+            field.from_numpy(array)
+        self._kinds.from_numpy(kinds)
+        self._slots.from_numpy(slots)
+        self.materials.from_numpy(materials)
+        self._n_objs[None] = len(self.objects)
+
+        emitters = np.zeros(self.capacity, dtype=np.int32)
+        emitters[: len(self.emitters)] = self.emitters
+        self._emitters.from_numpy(emitters)
+        self._n_emitters[None] = len(self.emitters)
+
+        self._upload_bvh()
+        if self.baked:
+            self._bake()
+
+    def _fill_mesh_bounds(self, obj) -> None:
+        if not 0 <= obj.mesh < len(self.meshes):
+            raise ValueError(
+                f"Mesh objects must refer to one of the scene's {len(self.meshes)} meshes, got mesh={obj.mesh}"
+            )
+        mesh = self.meshes[obj.mesh]
+        obj.radii = ti.Vector(mesh.extents)
+        obj.surface_area = mesh.area
+
+    def build_narrow_band(self, resolution: int = 128, band: float = 2.0) -> None:
+        """Speeds up distance queries near meshes with a sparse grid, see :meth:`mirari.mesh.MeshTables.build_narrow_band`
+
+        Must be called before any kernel using this scene is compiled.
+        """
+        self._mesh_tables.build_narrow_band(resolution, band)
+
+    def _upload_bvh(self) -> None:
+        centers = np.array([obj.origin.to_numpy() for obj in self.objects]).reshape(-1, 3)
+        radii = np.array([obj.bounding_radius() for obj in self.objects])
+        nodes = build_sphere_bvh(centers, radii)
+        n_nodes = max(2 * len(self.objects) - 1, 0)
+        padded = self._bvh.to_numpy()
+        for name, array in nodes.items():
+            padded[name][:n_nodes] = array[:n_nodes]
+        self._bvh.from_numpy(padded)
+        self._n_nodes[None] = n_nodes
+        # Object bounds are spheres about each origin, so the root still encloses the scene after attitude changes
+        self.bounding_sphere = None
+        if self.objects:
+            self.bounding_sphere = (nodes["center"][0].astype(np.float64), float(nodes["radius"][0]))
+
+    def precompile(self) -> None:
+        """Compiles the kernels that edit this scene, see :meth:`mirari.march.RayMarchRenderer.precompile`"""
+        self._set_attitudes(np.zeros(0, dtype=np.int32), np.zeros((0, 3), dtype=np.float32))
+
+    def set_attitudes(self, rvs: np.ndarray, indices: np.ndarray = None) -> None:
+        """Updates the attitudes of many objects in one transfer, rotation matrices are rebuilt once here and reused by every SDF query
+
+        :param rvs: Rotation vectors of the objects
+        :type rvs: np.ndarray [nx3]
+        :param indices: Indices of the objects to update, defaults to all objects in order
+        :type indices: np.ndarray [n,], optional
+        """
+        rvs = np.ascontiguousarray(rvs, dtype=np.float32).reshape(-1, 3)
+        if indices is None:
+            indices = np.arange(len(self.objects))
+        indices = np.ascontiguousarray(indices, dtype=np.int32).reshape(-1)
+        if indices.size != rvs.shape[0]:
+            raise ValueError("rvs and indices must have the same length")
+        if indices.size and (indices.min() < 0 or indices.max() >= len(self.objects)):
+            raise ValueError(f"Object indices must be in [0, {len(self.objects)})")
+        self._set_attitudes(indices, rvs)
+        for i, rv in zip(indices, rvs):
+            self.objects[i].set_attitude(ti.Vector(rv))
+        if self.baked:
+            self._bake()
+
+    @ti.kernel
+    def _set_attitudes(
+        self,
+        indices: ti.types.ndarray(dtype=ti.i32, ndim=1),
+        rvs: ti.types.ndarray(dtype=ti.math.vec3, ndim=1),
+    ):
+        for i in indices:
+            kind = self._kinds[indices[i]]
+            slot = self._slots[indices[i]]
+            for t in ti.static(range(len(PRIMITIVES))):
+                if kind == t:
+                    self._primitives[t][slot].rv = rvs[i]
+                    self._primitives[t][slot].dcm = attitude_dcm(rvs[i])
+
+    @ti.func
+    def clip(self, position: ti.math.vec3, direction: ti.math.vec3, max_dist: float):
+        """Distances along a unit-direction ray where it enters and leaves the scene's bounding sphere
+
+        Both distances are ``max_dist`` if the ray misses the sphere, the entry distance is zero if the ray starts inside it.
+        """
+        t0 = max_dist
+        t1 = max_dist
+        if self._n_nodes[None] > 0:
+            root = self._bvh[0]
+            oc = position - root.center
+            b = oc.dot(direction)
+            # Padded so that surfaces touching the sphere are still reached by the march
+            r = root.radius * (1 + 1e-4) + 1e-4
+            disc = b * b - (oc.dot(oc) - r * r)
+            if disc >= 0.0:
+                s = ti.sqrt(disc)
+                enter = ti.max(-b - s, 0.0)
+                leave = ti.min(-b + s, max_dist)
+                if enter < leave:
+                    t0, t1 = enter, leave
+        return t0, t1
+
+    @ti.func
+    def object_sdf(self, i: int, r: ti.math.vec3) -> float:
+        """Signed distance to the object at index ``i``"""
+        d = np.inf
+        kind = self._kinds[i]
+        for t in ti.static(range(len(PRIMITIVES))):
+            if kind == t:
+                field = ti.static(self._primitives[t])
+                slot = self._slots[i]
+                q = field.dcm[slot] @ (r - field.origin[slot])
+                if ti.static(t == MESH_KIND):
+                    d = self._mesh_tables.sdf(field.mesh[slot], q)
+                else:
+                    d = field[slot].sdf_local(q)
+        return d
+
+    @ti.func
+    def object_normal(self, i: int, r: ti.math.vec3) -> ti.math.vec3:
+        """Outward surface normal of the object at index ``i``
+
+        Analytic where the primitive provides ``normal_local``, the pseudo-normal of a mesh, and otherwise
+        differences of the primitive's SDF as in :meth:`object_normal_fd`.
+        """
+        n = ti.math.vec3(0.0)
+        kind = self._kinds[i]
+        for t in ti.static(range(len(PRIMITIVES))):
+            if kind == t:
+                obj = self._primitives[t][self._slots[i]]
+                q = obj.dcm @ (r - obj.origin)
+                if ti.static(t == MESH_KIND):
+                    n = obj.dcm.transpose() @ self._mesh_tables.normal(obj.mesh, q)
+                elif ti.static(ANALYTIC_NORMALS[t]):
+                    n = obj.dcm.transpose() @ obj.normal_local(q)
+                else:
+                    n = obj.dcm.transpose() @ _difference_normal(obj, q)
+        return n
 
     @ti.func
-    def _sdf(self, r):
-        ti.loop_config(serialize=False)
-        return [obj.sdf(r) for obj in ti.static(self.objects)]
+    def object_normal_fd(self, i: int, r: ti.math.vec3) -> ti.math.vec3:
+        """Surface normal of an analytic primitive at index ``i`` from tetrahedral differences of its SDF alone"""
+        n = ti.math.vec3(0.0)
+        kind = self._kinds[i]
+        for t in ti.static(range(len(PRIMITIVES))):
+            if ti.static(t != MESH_KIND):
+                if kind == t:
+                    obj = self._primitives[t][self._slots[i]]
+                    n = obj.dcm.transpose() @ _difference_normal(obj, obj.dcm @ (r - obj.origin))
+        return n
+
+    @ti.func
+    def object_area(self, i: int) -> float:
+        """Surface area of the object at index ``i``"""
+        a = 0.0
+        kind = self._kinds[i]
+        for t in ti.static(range(len(PRIMITIVES))):
+            if kind == t:
+                a = self._primitives[t][self._slots[i]].area()
+        return a
+
+    @ti.func
+    def sample_emitter(self, e0: float, e1: float, e2: float, e3: float):
+        """Samples a point uniformly by area on an emissive object chosen uniformly at random
+
+        :return: Point, outward normal, object index and density of the point per unit area, which is zero if there are no emitters
+        """
+        n_emitters = self._n_emitters[None]
+        p = ti.math.vec3(0.0)
+        n = ti.math.vec3(0.0)
+        idx = -1
+        pdf = 0.0
+        if n_emitters > 0:
+            idx = self._emitters[ti.min(ti.cast(e0 * n_emitters, ti.i32), n_emitters - 1)]
+            kind = self._kinds[idx]
+            for t in ti.static(range(len(PRIMITIVES))):
+                if kind == t:
+                    obj = self._primitives[t][self._slots[idx]]
+                    q = ti.math.vec3(0.0)
+                    n_local = ti.math.vec3(0.0)
+                    if ti.static(t == MESH_KIND):
+                        q, n_local = self._mesh_tables.sample_surface(obj.mesh, e1, e2, e3)
+                    else:
+                        q, n_local = obj.sample_surface_local(e1, e2, e3)
+                    p = obj.dcm.transpose() @ q + obj.origin
+                    n = obj.dcm.transpose() @ n_local
+                    pdf = 1 / (n_emitters * obj.area())
+        return p, n, idx, pdf
+
+    @ti.func
+    def emitter_pdf(self, i: int) -> float:
+        """Density per unit area with which :meth:`sample_emitter` picks points on the object at index ``i``"""
+        pdf = 0.0
+        if self.materials[i].emmissive:
+            pdf = 1 / (self._n_emitters[None] * self.object_area(i))
+        return pdf
+
+    def bake(self, resolution, bounds: np.ndarray) -> None:
+        """Samples the scene SDF onto a dense grid, distance queries then cost a trilinear lookup away from surfaces
+
+        Must be called before any kernel using this scene is compiled. Close to surfaces, queries fall back to
+        the exact SDF, so hits and normals are unaffected by the grid resolution.
+
+        :param resolution: Number of grid nodes along each axis, or a single number for all axes
+        :type resolution: int or Tuple[int, int, int]
+        :param bounds: Lower and upper corners of the grid, must enclose every object
+        :type bounds: np.ndarray [2x3]
+        """
+        self._init_grid(resolution, bounds)
+        self._bake()
+
+    def save_bake(self, path: str) -> None:
+        """Saves the baked grid to a ``.npy`` file that :meth:`load_bake` can memory map
+
+        The grid bounds and the box enclosing the scene are saved next to it in ``<path>_bounds.npy``, so
+        a grid is only loaded into the scene it was baked from.
+
+        :param path: Output path
+        :type path: str
+        """
+        if not self.baked:
+            raise ValueError("This Scene has not been baked, call Scene.bake first")
+        grid = np.lib.format.open_memmap(
+            path,
+            mode="w+",
+            dtype=[("dist", np.float32), ("obj", np.int32)],
+            shape=self._baked_dist.shape,
+        )
+        grid["dist"] = self._baked_dist.to_numpy()
+        grid["obj"] = self._baked_obj.to_numpy()
+        grid.flush()
+        np.save(_bounds_path(path), np.concatenate([self._grid_bounds, self._scene_box()]))
+
+    def load_bake(self, path: str) -> None:
+        """Loads a grid written by :meth:`save_bake` instead of baking it again
+
+        :param path: Path of the saved grid
+        :type path: str
+        """
+        saved = np.load(_bounds_path(path))
+        bounds, box = saved[:2], saved[2:]
+        if not np.allclose(box, self._scene_box(), rtol=1e-6, atol=1e-6, equal_nan=True):
+            raise ValueError(
+                f"The grid at {path} was baked for a scene spanning {box[0]} to {box[1]}, "
+                f"this scene spans {self._scene_box()[0]} to {self._scene_box()[1]}"
+            )
+        grid = np.load(path, mmap_mode="r")
+        self._init_grid(grid.shape, bounds)
+        self._baked_dist.from_numpy(np.ascontiguousarray(grid["dist"]))
+        self._baked_obj.from_numpy(np.ascontiguousarray(grid["obj"]))
+
+    def _init_grid(self, resolution, bounds: np.ndarray) -> None:
+        resolution = tuple(int(x) for x in np.broadcast_to(resolution, (3,)))
+        bounds = np.asarray(bounds, dtype=np.float64).reshape(2, 3)
+        if min(resolution) < 2:
+            raise ValueError("The baked grid needs at least two nodes along each axis")
+        self._check_bake_bounds(bounds)
+        if self.baked and resolution != self._baked_dist.shape:
+            raise ValueError("A Scene can only be baked at one resolution")
+        if not self.baked:
+            self._baked_dist = ti.field(dtype=ti.f32, shape=resolution)
+            self._baked_obj = ti.field(dtype=ti.i32, shape=resolution)
+        self._grid_bounds = bounds
+        self._grid_lo = ti.math.vec3(*bounds[0])
+        cell = (bounds[1] - bounds[0]) / (np.array(resolution) - 1)
+        self._grid_n = ti.Vector(resolution)
+        self._grid_cell = ti.math.vec3(*cell)
+        self._grid_diag = float(np.linalg.norm(cell))
+        self.baked = True
+
+    def aabb(self) -> np.ndarray:
+        """Axis-aligned box enclosing every object
+
+        :return: Lower and upper corners of the box
+        :rtype: np.ndarray [2x3]
+        """
+        centers = np.array([obj.origin.to_numpy() for obj in self.objects])
+        extents = np.array([obj.bounding_extents() for obj in self.objects])
+        return np.array([(centers - extents).min(axis=0), (centers + extents).max(axis=0)])
+
+    def _scene_box(self) -> np.ndarray:
+        # The box of an empty scene is nan, which only matches another empty scene
+        if not self.objects:
+            return np.full((2, 3), np.nan)
+        return self.aabb()
+
+    def _check_bake_bounds(self, bounds: np.ndarray) -> None:
+        if not self.objects:
+            return
+        box = self.aabb()
+        if np.any(bounds[0] > box[0]) or np.any(bounds[1] < box[1]):
+            raise ValueError(f"Bake bounds must enclose every object, {box[0]} to {box[1]}")
+
+    def _bake(self) -> None:
+        self._check_bake_bounds(self._grid_bounds)
+        self._bake_kernel(self._grid_lo, self._grid_cell)
+
+    @ti.kernel
+    def _bake_kernel(self, lo: ti.math.vec3, cell: ti.math.vec3):
+        for i, j, k in self._baked_dist:
+            d, obj = self._analytic_sdf(lo + cell * ti.math.vec3(i, j, k))
+            self._baked_dist[i, j, k] = d
+            self._baked_obj[i, j, k] = obj
 
     @ti.func
     def sdf(self, r):
-        dists = self._sdf(r)
+        """Signed distance to the nearest object and its index"""
+        min_dist = np.inf
+        min_idx = 0
+        if ti.static(self.baked):
+            min_dist, min_idx = self._baked_sdf(r)
+        else:
+            min_dist, min_idx = self._analytic_sdf(r)
+        return [min_dist, min_idx]
+
+    @ti.func
+    def _baked_sdf(self, r):
+        n = self._grid_n
+        # Trilinear interpolation overestimates a 1-Lipschitz distance by at most the
+        # cell diagonal, so subtracting it keeps the grid distance conservative
+        diag = ti.static(self._grid_diag)
+
+        p = (r - self._grid_lo) / self._grid_cell
+        pc = ti.math.clamp(p, 0.0, n - 1.0)
+        # Everything lies inside the grid, so the distance to it is also a lower bound
+        outside_dist = ((p - pc) * self._grid_cell).norm()
+
+        i = ti.min(ti.cast(ti.floor(pc), ti.i32), n - 2)
+        f = pc - i
+        d = 0.0
+        for c in ti.static(ti.grouped(ti.ndrange(2, 2, 2))):
+            w = f * c + (1 - f) * (1 - c)
+            d += w.x * w.y * w.z * self._baked_dist[i + c]
+        d = ti.max(outside_dist, d - outside_dist - diag)
+
+        min_dist = d
+        min_idx = self._baked_obj[ti.cast(ti.round(pc), ti.i32)]
+        if d < diag:
+            min_dist, min_idx = self._analytic_sdf(r)
+        return min_dist, min_idx
+
+    @ti.func
+    def _analytic_sdf(self, r):
+        min_dist = np.inf
+        min_idx = 0
+        if ti.static(self.use_bvh):
+            min_dist, min_idx = self._bvh_sdf(r)
+        else:
+            for i in range(self._n_objs[None]):
+                d = self.object_sdf(i, r)
+                if d < min_dist:
+                    min_dist = d
+                    min_idx = i
+        return [min_dist, min_idx]
+
+    @ti.func
+    def _bvh_sdf(self, r):
+        # The distance to a bounding sphere is a lower bound on the distance to anything
+        # inside it, so subtrees that cannot beat the current nearest object are skipped
         min_dist = np.inf
-        min_obj = self.objects[0]
-        ti.loop_config(serialize=False)
-        for i in ti.static(range(self._n_objs)):
-            if dists[i] < min_dist:
-                min_dist = dists[i]
-                min_obj = self.objects[i]
-        return [min_dist, min_obj]
+        min_idx = 0
+        i = 0
+        while i < self._n_nodes[None]:
+            node = self._bvh[i]
+            if (r - node.center).norm() - node.radius < min_dist:
+                if node.leaf >= 0:
+                    d = self.object_sdf(node.leaf, r)
+                    if d < min_dist:
+                        min_dist = d
+                        min_idx = node.leaf
+                i += 1
+            else:
+                i = node.skip
+        return min_dist, min_idx
 
 
 def cornell_box_scene():
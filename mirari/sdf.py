@@ -1,9 +1,26 @@
+import numpy as np
 import taichi as ti
 
-from .math import rv_to_dcm
+from .math import attitude_dcm
 from .material import Material
 
 
+def _set_attitude(self, rv: ti.math.vec3) -> None:
+    # Shared by every primitive, dcm caches the world to body rotation
+    self.rv = rv
+    self.dcm = attitude_dcm(rv)
+
+
+@ti.pyfunc
+def _body_dcm(obj) -> ti.math.mat3:
+    # Primitives that have not been through set_attitude or a Scene still hold the zero matrix,
+    # which is never a rotation, so their rotation is computed from rv instead
+    dcm = obj.dcm
+    if dcm[0, 0] == 0.0 and dcm[0, 1] == 0.0 and dcm[0, 2] == 0.0:
+        dcm = attitude_dcm(obj.rv)
+    return dcm
+
+
 @ti.dataclass
 class Box:
     # USED
@@ -11,18 +28,76 @@ class Box:
     radii: ti.math.vec3
     rv: ti.math.vec3
     material: Material
+    dcm: ti.math.mat3  # World to body rotation, cached by set_attitude
+
+    set_attitude = _set_attitude
+
+    def kind(self) -> str:
+        return "box"
 
     @ti.func
     def sdf(self, r: ti.math.vec3) -> float:
-        rmo = r - self.origin
-        if self.rv.norm() > 0.0:
-            rmo = rv_to_dcm(-self.rv) @ rmo
+        return self.sdf_local(_body_dcm(self) @ (r - self.origin))
 
-        q = ti.abs(rmo) - self.radii
+    @ti.func
+    def sdf_local(self, q: ti.math.vec3) -> float:
+        q = ti.abs(q) - self.radii
         return ti.Vector(
             [ti.max(0, q[0]), ti.max(0, q[1]), ti.max(0, q[2])]
         ).norm() + ti.min(q.max(), 0)
 
+    @ti.func
+    def normal_local(self, rmo: ti.math.vec3) -> ti.math.vec3:
+        s = ti.select(rmo >= 0.0, 1.0, -1.0)
+        q = ti.abs(rmo) - self.radii
+        n = ti.max(q, 0.0) * s
+        if q.max() <= 0.0:  # Inside, the nearest face is the one with the largest q
+            n = ti.math.vec3(0.0)
+            if q[0] >= q[1] and q[0] >= q[2]:
+                n[0] = s[0]
+            elif q[1] >= q[2]:
+                n[1] = s[1]
+            else:
+                n[2] = s[2]
+        return n.normalized()
+
+    @ti.func
+    def area(self) -> float:
+        a, b, c = self.radii[0], self.radii[1], self.radii[2]
+        return 8 * (b * c + a * c + a * b)
+
+    @ti.func
+    def sample_surface_local(self, e1: float, e2: float, e3: float):
+        # Faces are chosen in proportion to their area, the leftover of e1 picks the side
+        a, b, c = self.radii[0], self.radii[1], self.radii[2]
+        w = ti.math.vec3(b * c, a * c, a * b)
+        x = e1 * w.sum()
+        k = 2
+        if x < w[0]:
+            k = 0
+        elif x < w[0] + w[1]:
+            k = 1
+            x -= w[0]
+        else:
+            x -= w[0] + w[1]
+        side = ti.select(x / w[k] < 0.5, -1.0, 1.0)
+        s, t = 2 * e2 - 1, 2 * e3 - 1
+        n = ti.math.vec3(side, 0.0, 0.0)
+        q = ti.math.vec3(side, s, t)
+        if k == 1:
+            n = ti.math.vec3(0.0, side, 0.0)
+            q = ti.math.vec3(s, side, t)
+        elif k == 2:
+            n = ti.math.vec3(0.0, 0.0, side)
+            q = ti.math.vec3(s, t, side)
+        return q * self.radii, n
+
+    def bounding_radius(self) -> float:
+        return float(np.linalg.norm(self.radii.to_numpy()))
+
+    def bounding_extents(self) -> np.ndarray:
+        return np.abs(_body_dcm(self).to_numpy().T) @ self.radii.to_numpy()
+
 
 @ti.dataclass
 class Torus:
@@ -31,15 +106,54 @@ class Torus:
     radii: ti.math.vec3
     rv: ti.math.vec3
     material: Material
+    dcm: ti.math.mat3  # World to body rotation, cached by set_attitude
+
+    set_attitude = _set_attitude
+
+    def kind(self) -> str:
+        return "torus"
 
     @ti.func
     def sdf(self, r: ti.math.vec3) -> float:
-        rmo = r - self.origin
-        if self.rv.norm() > 0.0:
-            rmo = rv_to_dcm(-self.rv) @ rmo
+        return self.sdf_local(_body_dcm(self) @ (r - self.origin))
+
+    @ti.func
+    def sdf_local(self, rmo: ti.math.vec3) -> float:
         q = ti.Vector([ti.Vector([rmo[0], rmo[2]]).norm() - self.radii[0], rmo[1]])
         return q.norm() - self.radii[1]
 
+    @ti.func
+    def normal_local(self, rmo: ti.math.vec3) -> ti.math.vec3:
+        xz = ti.Vector([rmo[0], rmo[2]]).norm()
+        k = (xz - self.radii[0]) / xz
+        return ti.math.vec3(k * rmo[0], rmo[1], k * rmo[2]).normalized()
+
+    @ti.func
+    def area(self) -> float:
+        return 4 * np.pi**2 * self.radii[0] * self.radii[1]
+
+    @ti.func
+    def sample_surface_local(self, e1: float, e2: float, e3: float):
+        # The tube angle has density proportional to (R + r cos v), its CDF is inverted with Newton's method
+        R, r = self.radii[0], self.radii[1]
+        target = 2 * np.pi * R * e1
+        v = 2 * np.pi * e1
+        for _ in ti.static(range(6)):
+            v -= (R * v + r * ti.sin(v) - target) / (R + r * ti.cos(v))
+        u = 2 * np.pi * e2
+        n = ti.math.vec3(ti.cos(v) * ti.cos(u), ti.sin(v), ti.cos(v) * ti.sin(u))
+        q = R * ti.math.vec3(ti.cos(u), 0.0, ti.sin(u)) + r * n
+        return q, n
+
+    def bounding_radius(self) -> float:
+        return float(self.radii[0] + self.radii[1])
+
+    def bounding_extents(self) -> np.ndarray:
+        local = np.array(
+            [self.radii[0] + self.radii[1], self.radii[1], self.radii[0] + self.radii[1]]
+        )
+        return np.abs(_body_dcm(self).to_numpy().T) @ local
+
 
 @ti.dataclass
 class Sphere:
@@ -50,7 +164,69 @@ class Sphere:
 
     # UNUSED
     rv: ti.math.vec3
+    dcm: ti.math.mat3
+
+    set_attitude = _set_attitude
+
+    def kind(self) -> str:
+        return "sphere"
 
     @ti.func
     def sdf(self, r):
         return (r - self.origin).norm() - self.radii[0]
+
+    @ti.func
+    def sdf_local(self, q: ti.math.vec3) -> float:
+        return q.norm() - self.radii[0]
+
+    @ti.func
+    def normal_local(self, q: ti.math.vec3) -> ti.math.vec3:
+        return q.normalized()
+
+    @ti.func
+    def area(self) -> float:
+        return 4 * np.pi * self.radii[0] ** 2
+
+    @ti.func
+    def sample_surface_local(self, e1: float, e2: float, e3: float):
+        z = 1 - 2 * e1
+        xy = ti.sqrt(ti.max(0.0, 1 - z * z)) * ti.math.vec2(ti.cos(2 * np.pi * e2), ti.sin(2 * np.pi * e2))
+        n = ti.math.vec3(xy, z)
+        return self.radii[0] * n, n
+
+    def bounding_radius(self) -> float:
+        return float(self.radii[0])
+
+    def bounding_extents(self) -> np.ndarray:
+        return np.full(3, self.radii[0])
+
+
+@ti.dataclass
+class Mesh:
+    # USED
+    origin: ti.math.vec3
+    rv: ti.math.vec3
+    material: Material
+    dcm: ti.math.mat3  # World to body rotation, cached by set_attitude
+    mesh: ti.i32  # Index of the mirari.mesh.TriangleMesh in the Scene's meshes
+
+    # Filled in by the Scene from the TriangleMesh
+    radii: ti.math.vec3  # Largest absolute body coordinate of a vertex along each axis
+    surface_area: float
+
+    # Distances, normals and surface samples need the triangles, so the Scene answers them from its mesh tables
+
+    set_attitude = _set_attitude
+
+    def kind(self) -> str:
+        return "mesh"
+
+    @ti.func
+    def area(self) -> float:
+        return self.surface_area
+
+    def bounding_radius(self) -> float:
+        return float(np.linalg.norm(self.radii.to_numpy()))
+
+    def bounding_extents(self) -> np.ndarray:
+        return np.abs(_body_dcm(self).to_numpy().T) @ self.radii.to_numpy()
@@ -0,0 +1,125 @@
+from dataclasses import dataclass
+from statistics import NormalDist
+from typing import Tuple, Union
+
+import numpy as np
+
+
+@dataclass
+class BrightnessEstimate:
+    """A brightness estimate from batch means, fields are arrays when estimating a light curve"""
+
+    mean: Union[float, np.ndarray]
+    std_err: Union[float, np.ndarray]
+    ci_low: Union[float, np.ndarray]
+    ci_high: Union[float, np.ndarray]
+    n_batches: Union[int, np.ndarray]
+    confidence: float = 0.95
+
+    @property
+    def rel_err(self) -> Union[float, np.ndarray]:
+        """Standard error relative to the mean, zero where both are zero"""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rel_err = np.where(self.std_err == 0, 0.0, self.std_err / np.abs(self.mean))
+        return float(rel_err) if rel_err.ndim == 0 else rel_err
+
+    def moments(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Sum and sum of squares of the batch means and the number of batches, the inverse of :meth:`from_moments`
+
+        :return: Sums of the batch means, of their squares, and batch counts
+        :rtype: Tuple[np.ndarray, np.ndarray, np.ndarray]
+        """
+        n = np.asarray(self.n_batches, dtype=np.float64)
+        mean = np.asarray(self.mean, dtype=np.float64)
+        var = np.asarray(self.std_err, dtype=np.float64) ** 2 * n
+        return mean * n, var * np.maximum(n - 1, 0) + n * mean**2, n
+
+    @classmethod
+    def merge(cls, estimates: list, confidence: float = None) -> "BrightnessEstimate":
+        """Combines estimates of the same quantities made from independent batches
+
+        :param estimates: Estimates to combine, with matching shapes
+        :type estimates: list
+        :param confidence: Confidence level of the merged interval, defaults to that of the first estimate
+        :type confidence: float, optional
+        :return: Estimate over every batch of the inputs
+        :rtype: BrightnessEstimate
+        """
+        if not estimates:
+            raise ValueError("At least one estimate is needed to merge")
+        total, total_sq, n = (sum(m) for m in zip(*(e.moments() for e in estimates)))
+        if confidence is None:
+            confidence = estimates[0].confidence
+        return cls.from_moments(total, total_sq, n, confidence)
+
+    @classmethod
+    def from_moments(
+        cls,
+        total: Union[float, np.ndarray],
+        total_sq: Union[float, np.ndarray],
+        n_batches: Union[int, np.ndarray],
+        confidence: float = 0.95,
+    ) -> "BrightnessEstimate":
+        """Builds an estimate from the sum and sum of squares of independent batch means
+
+        :param total: Sum of the batch means
+        :type total: Union[float, np.ndarray]
+        :param total_sq: Sum of the squared batch means
+        :type total_sq: Union[float, np.ndarray]
+        :param n_batches: Number of batches
+        :type n_batches: Union[int, np.ndarray]
+        :param confidence: Two-sided confidence level of the interval, defaults to 0.95
+        :type confidence: float, optional
+        :return: Estimate of the mean with a normal confidence interval
+        :rtype: BrightnessEstimate
+        """
+        n = np.maximum(n_batches, 1)
+        mean = total / n
+        var = np.maximum(total_sq - n * mean**2, 0.0) / np.maximum(n - 1, 1)
+        std_err = np.sqrt(var / n)
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        if np.ndim(mean) == 0:
+            mean, std_err, n_batches = float(mean), float(std_err), int(n_batches)
+        else:
+            n_batches = np.asarray(n_batches).astype(np.int64)
+        return cls(
+            mean=mean,
+            std_err=std_err,
+            ci_low=mean - z * std_err,
+            ci_high=mean + z * std_err,
+            n_batches=n_batches,
+            confidence=confidence,
+        )
+
+
+# Reasons a path can end, in the order they are counted on-device
+TERMINATIONS = ("diverged", "light", "max_bounces", "roulette")
+
+
+@dataclass
+class RenderStats:
+    """Counters collected on-device during a render with ``collect_stats=True``"""
+
+    rays: int  # Marched rays, including shadow rays
+    march_steps: int
+    step_histogram: np.ndarray  # Number of rays that took each number of march steps
+    paths: int
+    bounces: int  # Surface hits over all paths
+    terminations: dict  # Number of paths that ended for each reason in TERMINATIONS
+    object_hits: np.ndarray  # Path vertices on each object of the scene
+    nan_count: int  # Samples with nan power, left out of the sums but still counted towards their termination reason
+
+    @property
+    def mean_steps(self) -> float:
+        """March steps per ray"""
+        return self.march_steps / max(self.rays, 1)
+
+    @property
+    def mean_bounces(self) -> float:
+        """Surface hits per path"""
+        return self.bounces / max(self.paths, 1)
+
+    @property
+    def divergence_rate(self) -> float:
+        """Fraction of paths that ended by leaving the scene"""
+        return self.terminations["diverged"] / max(self.paths, 1)
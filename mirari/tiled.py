@@ -0,0 +1,211 @@
+import os
+from typing import Iterator, Tuple
+
+import numpy as np
+import taichi as ti
+
+from .march import RayMarchRenderer
+
+
+@ti.data_oriented
+class TiledRenderer(RayMarchRenderer):
+    def __init__(
+        self,
+        *args,
+        tile_size: Tuple[int, int] = (256, 256),
+        image_path: str = None,
+        **kwargs,
+    ) -> None:
+        """A :class:`mirari.march.RayMarchRenderer` whose :meth:`render` works through the image in fixed-size tiles
+
+        No buffer the size of the image is allocated. Each tile is rendered into one reusable tile buffer
+        and reduced into the on-device brightness sums, so :meth:`sum`, :meth:`total_brightness` and
+        :meth:`brightness_estimate` work as usual while device memory depends only on ``tile_size``. With
+        ``image_path``, each finished tile is also added into a memory-mapped ``.npy`` image on disk, which
+        accumulates over renders like ``color_buffer`` and is zeroed by :meth:`reset_buffer`. An existing
+        image at ``image_path`` is opened rather than overwritten, and the image is part of the state that
+        :meth:`save_state`, :meth:`load_state` and :meth:`merge` work with.
+
+        Pixel samples depend only on the pixel and the batch, so tiled and untiled renders with the same
+        seed produce the same image. Arguments are those of :class:`mirari.march.RayMarchRenderer`, which
+        must not store an image.
+
+        :param tile_size: Pixels along each axis of a tile, defaults to (256, 256)
+        :type tile_size: Tuple[int, int], optional
+        :param image_path: Path of the ``.npy`` image written on disk, defaults to no image
+        :type image_path: str, optional
+        """
+        if kwargs.get("store_image", False) or kwargs.get("show_gui", False):
+            raise ValueError(
+                "TiledRenderer does not hold the image in memory, pass image_path to write it to disk"
+            )
+        super().__init__(*args, store_image=False, **kwargs)
+        if min(tile_size) < 1:
+            raise ValueError(f"tile_size must be positive, got {tile_size}")
+        self.tile_size = tuple(int(x) for x in tile_size)
+        self.image_path = image_path
+        self.image = None
+        self._has_image = image_path is not None
+        if self._has_image:
+            self._tile_buffer = ti.field(dtype=ti.f32, shape=self.tile_size)
+            if os.path.exists(image_path):
+                self.image = np.load(image_path, mmap_mode="r+")
+                if self.image.shape != self.res or self.image.dtype != np.float32:
+                    raise ValueError(
+                        f"{image_path} holds a {self.image.dtype} image of shape {self.image.shape}, "
+                        f"this renderer needs float32 of shape {self.res}"
+                    )
+            else:
+                self.image = np.lib.format.open_memmap(
+                    image_path, mode="w+", dtype=np.float32, shape=self.res
+                )
+
+    def tiles(self) -> Iterator[Tuple[int, int]]:
+        """Pixel index of the first corner of each tile, tiles at the far edges are cropped to the image"""
+        for u0 in range(0, self.res[0], self.tile_size[0]):
+            for v0 in range(0, self.res[1], self.tile_size[1]):
+                yield u0, v0
+
+    def precompile(self) -> None:
+        super().precompile()
+        # Zero samples per pixel launch the tile kernel with no work
+        self._render_tile(
+            0,
+            0,
+            0,
+            0,
+            0,
+            0,
+            ti.math.vec3(0.0, 0.0, -1.0),
+            0,
+            self.max_bounces,
+            self.camera.fov,
+            self.camera.res_vector,
+            self.camera.is_perspective,
+            self.divergence_dist,
+            self.max_march_steps,
+            0,
+        )
+        self._end_batch(0.0)
+
+    def render(self, light_normal: ti.math.vec3):
+        self._j += 1
+        if self.collect_stats:
+            self._reset_stats()
+        batch_seed = self._next_batch_seed()
+        bounds = self.pixel_bounds()
+        for u0, v0 in self.tiles():
+            if not self._overlaps(u0, v0, bounds):
+                continue  # Every pixel of the tile misses the scene, so it would add nothing
+            self._render_tile(
+                u0,
+                v0,
+                *bounds,
+                light_normal,
+                self.samples_per_pixel,
+                self.max_bounces,
+                self.camera.fov,
+                self.camera.res_vector,
+                self.camera.is_perspective,
+                self.divergence_dist,
+                self.max_march_steps,
+                batch_seed,
+            )
+            if self.image is not None:
+                u1 = min(u0 + self.tile_size[0], self.res[0])
+                v1 = min(v0 + self.tile_size[1], self.res[1])
+                tile = self._tile_buffer.to_numpy()
+                self.image[u0:u1, v0:v1] += tile[: u1 - u0, : v1 - v0]
+        self._end_batch(self._brightness_scale())
+        if self.image is not None:
+            self.image.flush()
+
+    def _overlaps(self, u0: int, v0: int, bounds: Tuple[int, int, int, int]) -> bool:
+        return (
+            u0 < bounds[1]
+            and bounds[0] < u0 + self.tile_size[0]
+            and v0 < bounds[3]
+            and bounds[2] < v0 + self.tile_size[1]
+        )
+
+    def reset_buffer(self):
+        super().reset_buffer()
+        if self.image is not None:
+            self.image[:] = 0.0
+            self.image.flush()
+
+    def load_state(self, path: str) -> None:
+        super().load_state(path)
+        if self.image is not None:
+            with np.load(path) as state:
+                self.image[:] = state["image"]
+            self.image.flush()
+
+    def merge(self, other) -> None:
+        super().merge(other)
+        if self.image is not None:
+            if isinstance(other, RayMarchRenderer):
+                self.image += other.image
+            else:
+                with np.load(other) as state:
+                    self.image += state["image"]
+            self.image.flush()
+
+    def _state(self) -> dict:
+        state = super()._state()
+        if self.image is not None:
+            state["image"] = self.image
+        return state
+
+    def _check_state(self, state: dict) -> None:
+        super()._check_state(state)
+        if self.image is not None and "image" not in state:
+            raise ValueError("The state has no image, it was saved without image_path")
+
+    @ti.kernel
+    def _render_tile(
+        self,
+        u0: int,
+        v0: int,
+        u_lo: int,
+        u_hi: int,
+        v_lo: int,
+        v_hi: int,
+        light_normal: ti.math.vec3,
+        samples_per_pixel: int,
+        max_bounces: int,
+        fov: float,
+        res: ti.math.vec2,
+        is_perspective: bool,
+        divergence_dist: float,
+        max_march_steps: int,
+        batch_seed: ti.u32,
+    ):
+        dcm = self.camera.orthonormalize()
+        for i, j in ti.ndrange(self.tile_size[0], self.tile_size[1]):
+            u, v = u0 + i, v0 + j
+            power = 0.0
+            if u_lo <= u < u_hi and v_lo <= v < v_hi:
+                power = self._render_pixel(
+                    u,
+                    v,
+                    light_normal,
+                    samples_per_pixel,
+                    max_bounces,
+                    fov,
+                    res,
+                    is_perspective,
+                    divergence_dist,
+                    max_march_steps,
+                    batch_seed,
+                    dcm,
+                    self.camera._pos(),
+                    0,
+                )
+            if ti.static(self._has_image):
+                self._tile_buffer[i, j] = power
+            self._power_sum[None] += power
+
+    @ti.kernel
+    def _end_batch(self, batch_scale: ti.f64):
+        self._accumulate_batch(batch_scale)
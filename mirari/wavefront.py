@@ -0,0 +1,213 @@
+import taichi as ti
+
+from .camera import Ray
+from .march import (
+    RayMarchRenderer,
+    _DIVERGED,
+    _LIGHT,
+    _MAX_BOUNCES,
+    _ROULETTE,
+)
+from .sampler import SamplerState, pixel_seed
+
+
+@ti.dataclass
+class PathState:
+    position: ti.math.vec3
+    direction: ti.math.vec3
+    throughput: float
+    radiance: float
+    bsdf_pdf: float  # Solid angle density of the last scattered direction, zero for camera rays
+    depth: ti.i32
+    pixel: ti.i32  # Flattened pixel index, u * res[1] + v
+    seed: ti.u32  # SamplerState of the path
+    index: ti.u32
+    dim: ti.u32
+    dist: float  # Distance to the next hit, or divergence_dist, filled by the march stage
+    normal: ti.math.vec3
+    obj: ti.i32
+    alive: ti.i32  # Whether the shade stage left the path to be scattered
+
+
+@ti.data_oriented
+class WavefrontRenderer(RayMarchRenderer):
+    def __init__(self, *args, **kwargs) -> None:
+        """A :class:`mirari.march.RayMarchRenderer` whose :meth:`render` runs each bounce as separate kernels over a queue of live paths
+
+        Instead of tracing each sample's whole path in one kernel, one sample of every pixel is generated
+        into a structure-of-arrays queue, then each bounce launches a march, a shade and a scatter kernel
+        over the paths still alive. The scatter kernel appends surviving paths to a second queue, so
+        paths that ended no longer occupy threads on later bounces. This balances work better than the
+        megakernel when path lengths vary a lot, at the cost of more kernel launches and memory traffic.
+
+        Paths draw the same samples as in :class:`mirari.march.RayMarchRenderer`, so both engines render
+        the same image for the same seed. Light curves are rendered by the inherited megakernel.
+        Arguments are those of :class:`mirari.march.RayMarchRenderer`.
+        """
+        super().__init__(*args, **kwargs)
+        n_pixels = self.res[0] * self.res[1]
+        # Ping-pong queues, the scatter stage compacts the live paths of one into the other
+        self._paths = PathState.field(shape=(2, n_pixels), layout=ti.Layout.SOA)
+        self._n_live = ti.field(dtype=ti.i32, shape=2)
+        # Power of each pixel over the samples of the current batch
+        self._wave_power = ti.field(dtype=ti.f32, shape=n_pixels)
+
+    def precompile(self) -> None:
+        super().precompile()
+        # Empty queues launch the bounce kernels with no work
+        self._generate(0, 0, 0, 0, 0, self.camera.fov, self.camera.res_vector, self.camera.is_perspective, 0)
+        self._n_live.fill(0)
+        self._march_paths(0, self.divergence_dist, self.max_march_steps)
+        self._shade(0, ti.math.vec3(0.0, 0.0, -1.0), self.max_bounces, self.divergence_dist, self.max_march_steps)
+        self._scatter_paths(0, 1)
+        self._accumulate_waves(0.0)
+
+    def render(self, light_normal: ti.math.vec3):
+        self._j += 1
+        if self.collect_stats:
+            self._reset_stats()
+        batch_seed = self._next_batch_seed()
+        bounds = self.pixel_bounds()
+        for s in range(self.samples_per_pixel):
+            self._generate(s, *bounds, self.camera.fov, self.camera.res_vector, self.camera.is_perspective, batch_seed)
+            src = 0
+            for _ in range(self.max_bounces):
+                self._march_paths(src, self.divergence_dist, self.max_march_steps)
+                self._shade(src, light_normal, self.max_bounces, self.divergence_dist, self.max_march_steps)
+                self._scatter_paths(src, 1 - src)
+                src = 1 - src
+        self._accumulate_waves(self._brightness_scale())
+
+    @ti.kernel
+    def _generate(
+        self,
+        sample: int,
+        u0: int,
+        u1: int,
+        v0: int,
+        v1: int,
+        fov: float,
+        res: ti.math.vec2,
+        is_perspective: bool,
+        batch_seed: ti.u32,
+    ):
+        dcm = self.camera.orthonormalize()
+        for u, v in ti.ndrange((u0, u1), (v0, v1)):
+            state = SamplerState(seed=pixel_seed(batch_seed, u, v, 0), index=sample, dim=0)
+            offset = self._uniform2(state)  # Position within the pixel
+            ray = self.camera.init_ray(u + offset.x, v + offset.y, pos=self.camera._pos(), fov=fov, res=res, dcm=dcm, is_perspective=is_perspective)
+            self._paths[0, (u - u0) * (v1 - v0) + v - v0] = PathState(
+                position=ray.position,
+                direction=ray.direction,
+                throughput=ray.power,
+                pixel=u * self.res[1] + v,
+                seed=state.seed,
+                index=state.index,
+                dim=state.dim,
+            )
+        self._n_live[0] = (u1 - u0) * (v1 - v0)
+
+    @ti.kernel
+    def _march_paths(self, src: int, divergence_dist: float, max_march_steps: int):
+        paths = ti.static(self._paths)
+        for k in range(self._n_live[src]):
+            ray = Ray(position=paths.position[src, k], direction=paths.direction[src, k], power=1.0)
+            dist, normal, obj = self.next_hit(
+                ray, divergence_dist, max_march_steps, self._stats_lane(paths.seed[src, k])
+            )
+            paths.dist[src, k] = dist
+            paths.normal[src, k] = normal
+            paths.obj[src, k] = obj
+
+    @ti.kernel
+    def _shade(
+        self,
+        src: int,
+        light_normal: ti.math.vec3,
+        max_bounces: int,
+        divergence_dist: float,
+        max_march_steps: int,
+    ):
+        paths = ti.static(self._paths)
+        for k in range(self._n_live[src]):
+            depth = paths.depth[src, k] + 1
+            paths.depth[src, k] = depth
+            dist = paths.dist[src, k]
+            obj = paths.obj[src, k]
+            direction = paths.direction[src, k]
+            normal = paths.normal[src, k]
+            alive = 0
+            reason = _MAX_BOUNCES
+            if dist == divergence_dist:
+                reason = _DIVERGED
+            else:
+                if ti.static(self.collect_stats):
+                    self._object_hits[self._stats_lane(paths.seed[src, k]), obj] += 1
+                material = self.scene.materials[obj]
+                if material.emmissive:
+                    reason = _LIGHT
+                    paths.radiance[src, k] += paths.throughput[src, k] * self._emission(
+                        material, direction, normal, dist, obj, paths.bsdf_pdf[src, k]
+                    )
+                elif depth < max_bounces:
+                    state = SamplerState(seed=paths.seed[src, k], index=paths.index[src, k], dim=paths.dim[src, k])
+                    hit_pos = paths.position[src, k] + dist * direction
+                    paths.radiance[src, k] += paths.throughput[src, k] * self._direct(
+                        hit_pos, normal, -direction, material, light_normal, divergence_dist, max_march_steps, state
+                    )
+                    paths.dim[src, k] = state.dim
+                    alive = 1
+            paths.alive[src, k] = alive
+            if not alive:
+                self._finish_path(src, k, reason)
+
+    @ti.kernel
+    def _scatter_paths(self, src: int, dst: int):
+        paths = ti.static(self._paths)
+        self._n_live[dst] = 0
+        for k in range(self._n_live[src]):
+            if paths.alive[src, k]:
+                state = SamplerState(seed=paths.seed[src, k], index=paths.index[src, k], dim=paths.dim[src, k])
+                material = self.scene.materials[paths.obj[src, k]]
+                direction = paths.direction[src, k]
+                wi, weight, pdf = self._scatter(material, paths.normal[src, k], -direction, state)
+                survived, throughput = self._roulette(
+                    paths.depth[src, k], paths.throughput[src, k] * weight, state
+                )
+                if survived:
+                    j = ti.atomic_add(self._n_live[dst], 1)
+                    hit_pos = paths.position[src, k] + paths.dist[src, k] * direction
+                    self._paths[dst, j] = PathState(
+                        position=hit_pos + 1e-5 * wi,
+                        direction=wi,
+                        throughput=throughput,
+                        radiance=paths.radiance[src, k],
+                        bsdf_pdf=pdf,
+                        depth=paths.depth[src, k],
+                        pixel=paths.pixel[src, k],
+                        seed=state.seed,
+                        index=state.index,
+                        dim=state.dim,
+                    )
+                else:
+                    self._finish_path(src, k, _ROULETTE)
+
+    @ti.func
+    def _finish_path(self, src: int, k: int, reason: int):
+        radiance = self._paths.radiance[src, k]
+        if ti.static(self.collect_stats):
+            lane = self._stats_lane(self._paths.seed[src, k])
+            self._count_path(lane, self._paths.depth[src, k], reason)
+        # Each pixel has one path per wave, so these adds never contend
+        self._wave_power[self._paths.pixel[src, k]] += self._valid_power(radiance, self._paths.seed[src, k])
+
+    @ti.kernel
+    def _accumulate_waves(self, batch_scale: ti.f64):
+        for u, v in ti.ndrange(self.res[0], self.res[1]):
+            i = u * self.res[1] + v
+            power = self._wave_power[i]
+            self._wave_power[i] = 0.0
+            if ti.static(self.store_image):
+                self.color_buffer[u, v] += power
+            self._power_sum[None] += power
+        self._accumulate_batch(batch_scale)
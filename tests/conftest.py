@@ -0,0 +1,11 @@
+import pytest
+import taichi as ti
+
+import mirari as mi
+
+
+@pytest.fixture(scope="module", autouse=True)
+def cpu():
+    mi.init(arch="cpu", offline_cache=False)
+    yield
+    ti.reset()
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from mirari.output import LightCurveWriter
+from mirari.stats import BrightnessEstimate
+
+
+def estimate(mean) -> BrightnessEstimate:
+    mean = np.asarray(mean, dtype=np.float64)
+    return BrightnessEstimate(
+        mean=mean,
+        std_err=0.1 * mean,
+        ci_low=None,
+        ci_high=None,
+        n_batches=np.full(mean.shape, 4),
+        confidence=0.95,
+    )
+
+
+def test_writer_resumes_at_the_first_unwritten_epoch(tmp_path):
+    path = str(tmp_path / "curve")
+    writer = LightCurveWriter(path, 4, image_shape=(2, 3))
+    writer.write(0, estimate([1.0, 2.0]), 8, images=np.ones((2, 2, 3)))
+    assert writer.next_epoch == 2
+
+    resumed = LightCurveWriter(path, 4, image_shape=(2, 3))
+    assert resumed.next_epoch == 2
+    np.testing.assert_array_equal(resumed.light_curve["brightness"][:2], [1.0, 2.0])
+    np.testing.assert_array_equal(resumed.light_curve["n_samples"][:2], [32, 32])
+    np.testing.assert_array_equal(resumed.images[:2], 1.0)
+    resumed.write(2, estimate([3.0, 4.0]), 8, images=np.zeros((2, 2, 3)))
+    assert resumed.next_epoch == 4
+    np.testing.assert_allclose(resumed.estimate().mean, [1.0, 2.0, 3.0, 4.0])
+
+    assert LightCurveWriter(path, 4, resume=False).next_epoch == 0
+    with pytest.raises(ValueError):
+        LightCurveWriter(path, 5)
@@ -0,0 +1,161 @@
+import numpy as np
+import pytest
+import taichi as ti
+
+import mirari as mi
+
+
+def make_camera(is_perspective: bool) -> mi.Camera:
+    return mi.Camera(
+        pos=ti.Vector([0.0, 0.0, 4.0]),
+        dir=ti.Vector([0.0, 0.0, -1.0]),
+        up=ti.Vector([0.0, 1.0, 0.0]),
+        fov=0.6 if is_perspective else 2.0,
+        res=(32, 32),
+        is_perspective=is_perspective,
+    )
+
+
+def render_sum(renderer_type=mi.RayMarchRenderer, is_perspective=False, **kwargs) -> float:
+    renderer = renderer_type(
+        scene=mi.Scene(objects=mi.cornell_box_scene()),
+        camera=make_camera(is_perspective),
+        max_bounces=4,
+        samples_per_pixel=2,
+        **kwargs,
+    )
+    renderer.set_seed(0)
+    renderer.render(ti.Vector([0.0, 0.0, -1.0]))
+    return renderer.sum()
+
+
+def test_cornell_box_renders_on_cpu():
+    power = render_sum()
+    assert np.isfinite(power)
+    assert power > 0.0
+
+
+@pytest.mark.parametrize("with_image", [False, True])
+def test_tiled_matches_untiled(tmp_path, with_image):
+    image_path = str(tmp_path / "image.npy") if with_image else None
+    tiled = render_sum(mi.TiledRenderer, tile_size=(12, 20), image_path=image_path)
+    assert tiled == pytest.approx(render_sum(), rel=1e-5)
+
+
+@pytest.mark.parametrize("is_perspective", [False, True])
+def test_clip_rays_matches_unclipped(is_perspective):
+    clipped = render_sum(is_perspective=is_perspective, clip_rays=True)
+    unclipped = render_sum(is_perspective=is_perspective, clip_rays=False)
+    assert clipped > 0.0
+    assert clipped == pytest.approx(unclipped, rel=1e-5)
+
+
+def test_light_curve_matches_render():
+    renderer = mi.RayMarchRenderer(
+        scene=mi.Scene(objects=mi.cornell_box_scene()),
+        camera=make_camera(False),
+        max_bounces=4,
+        samples_per_pixel=2,
+    )
+    renderer.set_seed(0)
+    curve = renderer.render_light_curve(np.array([[0.0, 0.0, -1.0]]), np.array([[0.0, 0.0, 1.0]]))
+    renderer.set_seed(0)
+    renderer.render(ti.Vector([0.0, 0.0, -1.0]))
+    assert curve[0] == pytest.approx(renderer.total_brightness(), rel=1e-5)
+
+
+@pytest.mark.parametrize("renderer_type", [mi.RayMarchRenderer, mi.WavefrontRenderer])
+def test_precompile_keeps_accumulated_state(renderer_type):
+    renderer = renderer_type(
+        scene=mi.Scene(objects=mi.cornell_box_scene()),
+        camera=make_camera(False),
+        max_bounces=4,
+        samples_per_pixel=2,
+        collect_stats=True,
+    )
+    renderer.render(ti.Vector([0.0, 0.0, -1.0]))
+    before, stats = renderer._state(), renderer.render_stats()
+    renderer.precompile()
+    after = renderer._state()
+    for key, value in before.items():
+        np.testing.assert_array_equal(after[key], value)
+    for key, value in vars(stats).items():
+        np.testing.assert_array_equal(getattr(renderer.render_stats(), key), value)
+
+
+def test_tiled_image_resumes_from_saved_state(tmp_path):
+    def tiled():
+        return mi.TiledRenderer(
+            scene=mi.Scene(objects=mi.cornell_box_scene()),
+            camera=make_camera(False),
+            max_bounces=4,
+            samples_per_pixel=2,
+            tile_size=(12, 20),
+            image_path=str(tmp_path / "image.npy"),
+        )
+
+    light_normal = ti.Vector([0.0, 0.0, -1.0])
+    continuous = tiled()
+    continuous.render(light_normal)
+    continuous.save_state(str(tmp_path / "state.npz"))
+    continuous.render(light_normal)
+    expected = np.array(continuous.image)
+
+    resumed = tiled()
+    np.testing.assert_array_equal(resumed.image, expected)  # Reopened, not truncated
+    resumed.load_state(str(tmp_path / "state.npz"))
+    resumed.render(light_normal)
+    np.testing.assert_allclose(resumed.image, expected, rtol=1e-6)
+    assert resumed.sum() == pytest.approx(continuous.sum(), rel=1e-6)
+
+
+def make_renderer(renderer_type=mi.RayMarchRenderer, **kwargs) -> mi.RayMarchRenderer:
+    return renderer_type(
+        scene=mi.Scene(objects=mi.cornell_box_scene()),
+        camera=make_camera(False),
+        max_bounces=4,
+        samples_per_pixel=2,
+        **kwargs,
+    )
+
+
+def test_wavefront_matches_megakernel():
+    assert render_sum(mi.WavefrontRenderer) == pytest.approx(render_sum(), rel=1e-5)
+
+
+def test_resumed_render_matches_continuous(tmp_path):
+    path = str(tmp_path / "state.npz")
+    light_normal = ti.Vector([0.0, 0.0, -1.0])
+    continuous = make_renderer()
+    continuous.set_seed(3)
+    continuous.render(light_normal)
+    continuous.save_state(path)
+    continuous.render(light_normal)
+
+    resumed = make_renderer()
+    resumed.load_state(path)
+    resumed.render(light_normal)
+    assert resumed.sum() == pytest.approx(continuous.sum(), rel=1e-6)
+    np.testing.assert_allclose(resumed.color_buffer.to_numpy(), continuous.color_buffer.to_numpy(), rtol=1e-6)
+    assert resumed.brightness_estimate().n_batches == 2
+
+
+def test_merge_adds_the_samples_of_shards(tmp_path):
+    light_normal = ti.Vector([0.0, 0.0, -1.0])
+    shards = [make_renderer(), make_renderer()]
+    for seed, shard in enumerate(shards):
+        shard.set_seed(seed)
+        shard.render(light_normal)
+    shards[1].save_state(str(tmp_path / "shard.npz"))
+    assert shards[0].sum() != shards[1].sum()
+
+    merged = make_renderer()
+    merged.merge(shards[0])
+    merged.merge(str(tmp_path / "shard.npz"))
+    assert merged.sum() == pytest.approx(shards[0].sum() + shards[1].sum(), rel=1e-6)
+    np.testing.assert_allclose(
+        merged.color_buffer.to_numpy(),
+        shards[0].color_buffer.to_numpy() + shards[1].color_buffer.to_numpy(),
+        rtol=1e-6,
+    )
+    assert merged.brightness_estimate().n_batches == 2
@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+import taichi as ti
+
+import mirari as mi
+from mirari.sdf import Box, Mesh, Sphere, Torus
+
+
+@ti.kernel
+def box_sdf(box: Box, p: ti.math.vec3) -> float:
+    return box.sdf(p)
+
+
+@ti.kernel
+def torus_sdf(torus: Torus, p: ti.math.vec3) -> float:
+    return torus.sdf(p)
+
+
+def test_bare_primitives_use_their_attitude():
+    rv = ti.Vector([0.0, 0.0, np.pi / 2])
+    box = Box(origin=ti.Vector([1.0, 0.0, 0.0]), radii=ti.Vector([1.0, 0.5, 0.25]), rv=rv)
+    torus = Torus(origin=ti.Vector([0.0, 0.0, 0.0]), radii=ti.Vector([1.0, 0.25, 0.0]), rv=rv)
+    points = [ti.Vector([3.0, 0.0, 0.0]), ti.Vector([1.0, 2.0, 0.5])]
+    bare = [box_sdf(box, p) for p in points] + [torus_sdf(torus, p) for p in points]
+    np.testing.assert_allclose(box.bounding_extents(), [0.5, 1.0, 0.25], atol=1e-6)
+    box.set_attitude(rv)
+    torus.set_attitude(rv)
+    cached = [box_sdf(box, p) for p in points] + [torus_sdf(torus, p) for p in points]
+    assert bare == pytest.approx(cached, abs=1e-6)
+    assert bare[0] == pytest.approx(1.5)
+
+
+@ti.kernel
+def scene_sdf(scene: ti.template(), p: ti.math.vec3) -> float:
+    d, _ = scene.sdf(p)
+    return d
+
+
+def test_load_bake_restores_the_grid_of_its_scene(tmp_path):
+    path = str(tmp_path / "grid.npy")
+    baked = mi.Scene(objects=mi.cornell_box_scene())
+    baked.bake(12, baked.aabb() + np.array([[-0.1], [0.1]]))
+    baked.save_bake(path)
+    loaded = mi.Scene(objects=mi.cornell_box_scene())
+    loaded.load_bake(path)
+    for p in ([0.0, 0.0, 0.0], [0.3, -0.4, 0.2], [2.0, 1.0, 3.0]):
+        assert scene_sdf(loaded, ti.Vector(p)) == scene_sdf(baked, ti.Vector(p))
+    with pytest.raises(ValueError):
+        mi.Scene(objects=mi.simple_scene()).load_bake(path)
+
+
+@ti.kernel
+def normal_error(scene: ti.template(), i: int, p: ti.math.vec3) -> float:
+    return (scene.object_normal(i, p) - scene.object_normal_fd(i, p)).norm()
+
+
+def test_difference_normals_match_analytic_normals():
+    scene = mi.Scene(objects=mi.scene_three_objs())
+    direction = np.array([0.3, 0.5, 0.8]) / np.linalg.norm([0.3, 0.5, 0.8])
+    for i, obj in enumerate(scene.objects):
+        p = obj.origin.to_numpy() + direction * (obj.bounding_radius() + 0.05)
+        assert normal_error(scene, i, ti.Vector(p)) < 1e-2
+
+
+def cube_mesh(half: float) -> mi.TriangleMesh:
+    corners = np.array([[x, y, z] for z in (-1, 1) for y in (-1, 1) for x in (-1, 1)]) * half
+    faces = []
+    for axis in range(3):
+        a, b = (axis + 1) % 3, (axis + 2) % 3
+        for side in (-1, 1):
+            quad = [
+                next(i for i, c in enumerate(corners) if np.sign(c[[axis, a, b]]).tolist() == [side, sa, sb])
+                for sa, sb in ((-1, -1), (1, -1), (1, 1), (-1, 1))
+            ]
+            for tri in ([quad[0], quad[1], quad[2]], [quad[0], quad[2], quad[3]]):
+                u, v, w = corners[tri]
+                if np.cross(v - u, w - u)[axis] * side < 0:
+                    tri = tri[::-1]
+                faces.append(tri)
+    return mi.TriangleMesh(corners, np.array(faces))
+
+
+def test_mesh_cube_matches_box():
+    origin, rv = ti.Vector([0.2, -0.1, 0.3]), ti.Vector([0.3, -0.2, 0.5])
+    mesh = mi.Scene(objects=(Mesh(origin=origin, rv=rv, mesh=0),), meshes=[cube_mesh(0.5)])
+    box = mi.Scene(objects=(Box(origin=origin, radii=ti.Vector([0.5, 0.5, 0.5]), rv=rv),))
+    # Inside, on the far side of an edge, and beyond a corner
+    for p in ([0.2, -0.1, 0.3], [0.4, 0.0, 0.2], [1.2, 0.6, -0.4], [-1.0, -1.0, 1.5]):
+        assert scene_sdf(mesh, ti.Vector(p)) == pytest.approx(scene_sdf(box, ti.Vector(p)), abs=1e-5)
+
+
+def test_baked_sdf_matches_analytic():
+    analytic = mi.Scene(objects=mi.scene_three_objs())
+    baked = mi.Scene(objects=mi.scene_three_objs())
+    bounds = baked.aabb() + np.array([[-0.5], [0.5]])
+    baked.bake(32, bounds)
+    spacing = np.linalg.norm((bounds[1] - bounds[0]) / 31)
+    rng = np.random.default_rng(0)
+    # The grid distance is a lower bound within two cell diagonals, and exact close to surfaces
+    for p in rng.uniform(bounds[0], bounds[1], size=(50, 3)):
+        exact = scene_sdf(analytic, ti.Vector(p))
+        d = scene_sdf(baked, ti.Vector(p))
+        assert exact - 2 * spacing <= d <= exact + 1e-5
+        if exact < spacing:
+            assert d == pytest.approx(exact, abs=1e-5)
+
+
+def test_add_update_remove_objects():
+    scene = mi.Scene(objects=(Box(origin=ti.Vector([0.0, 0.0, 0.0]), radii=ti.Vector([0.5, 0.5, 0.5])),))
+    p = ti.Vector([2.0, 0.0, 0.0])
+    assert scene_sdf(scene, p) == pytest.approx(1.5)
+    i = scene.add(Sphere(origin=ti.Vector([2.0, 0.5, 0.0]), radii=ti.Vector([0.25, 0.0, 0.0])))
+    assert scene_sdf(scene, p) == pytest.approx(0.25)
+    scene.update(i, Sphere(origin=ti.Vector([2.0, 0.0, 0.0]), radii=ti.Vector([0.25, 0.0, 0.0])))
+    assert scene_sdf(scene, p) == pytest.approx(-0.25)
+    scene.remove(i)
+    assert scene_sdf(scene, p) == pytest.approx(1.5)